@@ -54,7 +54,7 @@ except ImportError:
 from track_changes import aplicar_revisoes_docx, aplicar_comentarios_docx, TrackChangesApplicator
 
 # LLM e Prompts para agentes de revisao
-from llm_client import criar_cliente_llm
+from llm_client import criar_cliente_llm, criar_cliente_llm_async
 from prompts_revisao import (
     formatar_prompt_seo,
     formatar_prompt_tecnico,
@@ -1050,6 +1050,46 @@ def _e_erro_de_fetch_de_imagem(err: Exception) -> bool:
     return any(m in msg for m in marcadores)
 
 
+class FalhaRetryImagens(Exception):
+    """O retry com as imagens em base64 tambem falhou (ver _gerar_resposta_imagens_com_retry)."""
+
+
+def _gerar_resposta_imagens_com_retry(llm_client, system_prompt: str, user_prompt: str,
+                                      imagens: list, artigo_context: str) -> str:
+    """
+    Chama o agente de imagens (visao + busca web na Anthropic, so visao na
+    OpenAI). Se o provedor falhar ao buscar alguma imagem por URL (robots.txt,
+    403, timeout do fetcher), memoriza as URLs recusadas e tenta de novo
+    baixando tudo localmente como base64. Outros erros sobem como vieram;
+    se o retry tambem falhar, levanta FalhaRetryImagens.
+    """
+    try:
+        return llm_client.gerar_resposta_com_imagens_e_busca(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            imagens=imagens,
+            artigo_context=artigo_context
+        )
+    except Exception as llm_err:
+        print(f"❌ Erro ao chamar LLM: {type(llm_err).__name__}: {llm_err}")
+        if not _e_erro_de_fetch_de_imagem(llm_err):
+            raise
+        llm_client.registrar_urls_recusadas(llm_err)
+
+    print("🔁 Retry: reenviando todas as imagens como base64...")
+    try:
+        return llm_client.gerar_resposta_com_imagens_e_busca(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            imagens=imagens,
+            artigo_context=artigo_context,
+            forcar_base64=True
+        )
+    except Exception as retry_err:
+        print(f"❌ Retry com base64 tambem falhou: {type(retry_err).__name__}: {retry_err}")
+        raise FalhaRetryImagens(f"{type(retry_err).__name__}: {retry_err}") from retry_err
+
+
 def convert_relative_url(url: str, base_url: str) -> str:
     if not url:
         return url
@@ -2504,8 +2544,8 @@ async def revisao_agente_seo(payload: RevisaoAgentPayload):
         )
 
         # Chama LLM
-        llm_client = criar_cliente_llm(provider=payload.provider)
-        resposta = llm_client.gerar_resposta(system_prompt, user_prompt, artigo_context=artigo_context)
+        llm_client = criar_cliente_llm_async(provider=payload.provider)
+        resposta = await llm_client.gerar_resposta_com_cache(system_prompt, user_prompt, artigo_context=artigo_context)
         revisoes = llm_client.extrair_json(resposta)
 
         # Garante tipo SEO
@@ -2573,8 +2613,8 @@ async def revisao_agente_tecnico(payload: RevisaoAgentPayload):
         )
 
         # Chama LLM (com busca web quando disponivel)
-        llm_client = criar_cliente_llm(provider=payload.provider)
-        resposta = llm_client.gerar_resposta_com_busca(system_prompt, user_prompt, artigo_context=artigo_context)
+        llm_client = criar_cliente_llm_async(provider=payload.provider)
+        resposta = await llm_client.gerar_resposta_com_cache(system_prompt, user_prompt, artigo_context=artigo_context, busca=True)
         revisoes = llm_client.extrair_json(resposta)
 
         # Garante tipo TECNICO
@@ -2640,8 +2680,8 @@ async def revisao_agente_texto(payload: RevisaoAgentPayload):
         )
 
         # Chama LLM
-        llm_client = criar_cliente_llm(provider=payload.provider)
-        resposta = llm_client.gerar_resposta(system_prompt, user_prompt, artigo_context=artigo_context)
+        llm_client = criar_cliente_llm_async(provider=payload.provider)
+        resposta = await llm_client.gerar_resposta_com_cache(system_prompt, user_prompt, artigo_context=artigo_context)
         revisoes = llm_client.extrair_json(resposta)
 
         # Garante tipo TEXTO
@@ -2714,8 +2754,12 @@ async def revisao_agente_seo_form(
         # Formata palavras-chave
         palavras_formatadas = "Nenhuma palavra-chave especifica fornecida. Use seu conhecimento de SEO."
         if palavras_chave and palavras_chave.strip():
-            # Aceita separacao por virgula ou quebra de linha
-            keywords = [kw.strip() for kw in palavras_chave.replace('\n', ',').split(',') if kw.strip()]
+            # Aceita separacao por virgula ou quebra de linha. Mantem a ordem
+            # informada (prioridade) e descarta repetidas, para que o mesmo
+            # conjunto de palavras gere sempre o mesmo prompt
+            keywords = list(dict.fromkeys(
+                kw.strip() for kw in palavras_chave.replace('\n', ',').split(',') if kw.strip()
+            ))
             if keywords:
                 palavras_formatadas = "\n".join([f"- {kw}" for kw in keywords])
 
@@ -2729,8 +2773,8 @@ async def revisao_agente_seo_form(
         )
 
         # Chama LLM
-        llm_client = criar_cliente_llm(provider=provider)
-        resposta = llm_client.gerar_resposta(system_prompt, user_prompt, artigo_context=artigo_context)
+        llm_client = criar_cliente_llm_async(provider=provider)
+        resposta = await llm_client.gerar_resposta_com_cache(system_prompt, user_prompt, artigo_context=artigo_context)
         revisoes = llm_client.extrair_json(resposta)
 
         for rev in revisoes:
@@ -2781,8 +2825,8 @@ async def revisao_agente_tecnico_form(
             data_publicacao=data_publicacao
         )
 
-        llm_client = criar_cliente_llm(provider=provider)
-        resposta = llm_client.gerar_resposta_com_busca(system_prompt, user_prompt, artigo_context=artigo_context)
+        llm_client = criar_cliente_llm_async(provider=provider)
+        resposta = await llm_client.gerar_resposta_com_cache(system_prompt, user_prompt, artigo_context=artigo_context, busca=True)
         revisoes = llm_client.extrair_json(resposta)
 
         for rev in revisoes:
@@ -2827,8 +2871,8 @@ async def revisao_agente_texto_form(
             url=url_artigo
         )
 
-        llm_client = criar_cliente_llm(provider=provider)
-        resposta = llm_client.gerar_resposta(system_prompt, user_prompt, artigo_context=artigo_context)
+        llm_client = criar_cliente_llm_async(provider=provider)
+        resposta = await llm_client.gerar_resposta_com_cache(system_prompt, user_prompt, artigo_context=artigo_context)
         revisoes = llm_client.extrair_json(resposta)
 
         for rev in revisoes:
@@ -2922,15 +2966,20 @@ async def revisao_agente_imagem(payload: RevisaoImagemPayload):
             print(f"🤖 Chamando LLM ({payload.provider}) com {len(imagens)} imagens...")
 
             try:
-                resposta = llm_client.gerar_resposta_com_imagens_e_busca(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    imagens=imagens,
-                    artigo_context=artigo_context
+                resposta = _gerar_resposta_imagens_com_retry(
+                    llm_client, system_prompt, user_prompt, imagens, artigo_context
                 )
-            except Exception as llm_err:
-                print(f"❌ Erro ao chamar LLM: {type(llm_err).__name__}: {llm_err}")
-                raise
+            except FalhaRetryImagens as retry_err:
+                # Nao derruba a revisao inteira por causa das imagens: os outros
+                # agentes ja entregaram. Retorna vazio com o motivo explicito.
+                return {
+                    "tipo": "IMAGEM",
+                    "total_sugestoes": 0,
+                    "total_imagens": len(imagens),
+                    "revisoes": [],
+                    "erro": str(retry_err),
+                    "mensagem": "Nao foi possivel analisar as imagens do artigo"
+                }
 
             print(f"📝 Resposta recebida ({len(resposta) if resposta else 0} chars)")
             print(f"📝 Preview: {resposta[:500] if resposta else 'VAZIA'}...")
@@ -3052,41 +3101,20 @@ async def revisao_agente_imagem_form(
         print(f"🤖 Chamando LLM ({provider}) com {len(imagens)} imagens...")
 
         try:
-            resposta = llm_client.gerar_resposta_com_imagens_e_busca(
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                imagens=imagens,
-                artigo_context=artigo_context
+            resposta = _gerar_resposta_imagens_com_retry(
+                llm_client, system_prompt, user_prompt, imagens, artigo_context
             )
-        except Exception as llm_err:
-            print(f"❌ Erro ao chamar LLM: {type(llm_err).__name__}: {llm_err}")
-
-            # Falha ao buscar imagem por URL (robots.txt, 403, timeout do fetcher
-            # do provedor): tenta de novo baixando tudo localmente como base64.
-            if not _e_erro_de_fetch_de_imagem(llm_err):
-                raise
-
-            print("🔁 Retry: reenviando todas as imagens como base64...")
-            try:
-                resposta = llm_client.gerar_resposta_com_imagens_e_busca(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    imagens=imagens,
-                    artigo_context=artigo_context,
-                    forcar_base64=True
-                )
-            except Exception as retry_err:
-                # Nao derruba a revisao inteira por causa das imagens: os outros
-                # agentes ja entregaram. Retorna vazio com o motivo explicito.
-                print(f"❌ Retry com base64 tambem falhou: {type(retry_err).__name__}: {retry_err}")
-                return {
-                    "tipo": "IMAGEM",
-                    "total_sugestoes": 0,
-                    "total_imagens": len(imagens),
-                    "revisoes": [],
-                    "erro": f"{type(retry_err).__name__}: {retry_err}",
-                    "mensagem": "Nao foi possivel analisar as imagens do artigo"
-                }
+        except FalhaRetryImagens as retry_err:
+            # Nao derruba a revisao inteira por causa das imagens: os outros
+            # agentes ja entregaram. Retorna vazio com o motivo explicito.
+            return {
+                "tipo": "IMAGEM",
+                "total_sugestoes": 0,
+                "total_imagens": len(imagens),
+                "revisoes": [],
+                "erro": str(retry_err),
+                "mensagem": "Nao foi possivel analisar as imagens do artigo"
+            }
 
         print(f"📝 Resposta recebida ({len(resposta) if resposta else 0} chars)")
         print(f"📝 Preview: {resposta[:500] if resposta else 'VAZIA'}...")
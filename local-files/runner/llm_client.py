@@ -3,17 +3,27 @@ Cliente unificado para LLMs (Anthropic Claude e OpenAI GPT).
 Permite alternar entre provedores via configuracao.
 Suporta texto, busca web e visao multimodal.
 """
+import asyncio
 import base64
+import hashlib
 import io
 import json
 import os
 import re
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 import httpx
 from PIL import Image as PILImage
 from urllib.parse import urlparse
 
+try:
+    import orjson
+except ImportError:  # orjson e opcional; sem ele usa o json da stdlib
+    orjson = None
+
 
 # Limite de 5MB para imagens (API Anthropic)
 # Base64 encoding aumenta o tamanho em ~33%, entao o limite original deve ser ~3.75MB
@@ -21,31 +31,143 @@ MAX_IMAGE_SIZE_BYTES = 5 * 1024 * 1024  # 5 MB (limite da API para base64)
 MAX_IMAGE_SIZE_ORIGINAL = int(MAX_IMAGE_SIZE_BYTES * 0.75)  # ~3.75MB (limite pre-base64)
 # Limite de dimensao para requisicoes com multiplas imagens (API Anthropic)
 MAX_IMAGE_DIMENSION = 2000  # pixels
-
-
-def _e_url_cdn_publica(url: str) -> bool:
+# Content-types aceitos pelas APIs de visao -> media_type enviado
+MEDIA_TYPE_MAP = {
+    'image/jpeg': 'image/jpeg',
+    'image/jpg': 'image/jpeg',
+    'image/png': 'image/png',
+    'image/gif': 'image/gif',
+    'image/webp': 'image/webp',
+}
+# Orcamento do cache de imagens em base64 (compartilhado entre agentes/requisicoes)
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+
+# URLs de imagem que o fetcher da Anthropic recusou: quantas memorizar e por
+# quanto tempo (a recusa pode deixar de valer, ex: robots.txt alterado)
+URLS_RECUSADAS_MAX_ITEMS = 1024
+URLS_RECUSADAS_TTL = 24 * 60 * 60  # segundos
+
+# Cache de respostas dos agentes de texto: reexecutar o mesmo artigo com os
+# mesmos prompts devolve a resposta anterior sem gastar tokens
+RESPONSE_CACHE_TTL = int(os.getenv("LLM_RESPONSE_CACHE_TTL", "0"))  # segundos (0 = desligado)
+RESPONSE_CACHE_MAX_ITEMS = 256
+
+# Cliente HTTP compartilhado: reaproveita conexoes (keep-alive/TLS) entre downloads
+_http_client = httpx.Client(follow_redirects=True)
+
+# Clientes HTTP dos SDKs (um por provedor, sincrono e assincrono), compartilhados
+# entre instancias para que o pool de conexoes (e o TLS ja negociado)
+# sobreviva a cada criar_cliente_llm() / criar_cliente_llm_async(). Os
+# assincronos ficam presos ao event loop em que foram criados (o do uvicorn)
+_sdk_http_clients = {}
+_sdk_http_clients_lock = threading.Lock()
+
+# Tarefas de pre-aquecimento assincronas em andamento (referencia forte para
+# o event loop nao descarta-las antes de terminar)
+_tarefas_pre_aquecimento = set()
+
+# LRU url -> expira_em das URLs que o fetcher do provedor ja recusou
+# (robots.txt, 403, timeout): nas proximas requisicoes vao direto como
+# base64, sem repetir a falha
+_urls_recusadas = OrderedDict()
+_urls_recusadas_lock = threading.Lock()
+
+# Cache LRU chave dos prompts -> (expira_em, resposta), ver RESPONSE_CACHE_TTL
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Cache LRU url -> (base64_data, media_type), limitado por bytes e nao por itens
+_image_cache = OrderedDict()
+_image_cache_bytes = 0
+_image_cache_lock = threading.Lock()
+
+# Diagnostico detalhado (🔎) de LLMClient.extrair_json; desligado por padrao
+EXTRAIR_JSON_DEBUG = os.getenv("EXTRAIR_JSON_DEBUG", "").lower() in ("1", "true")
+
+# Regexes usados por LLMClient.extrair_json (compilados uma unica vez)
+FENCE_ABERTURA_RE = re.compile(r'^```\w*\s*\n?')
+FENCE_FECHAMENTO_RE = re.compile(r'\n?```\s*$')
+INICIO_ARRAY_REVISOES_RE = re.compile(r'\[\s*[{\]]')
+DELIMITADOR_JSON_RE = re.compile(r'[][{}"\\]')
+
+# Posicao do bloco de imagem citado num erro da API
+# (ex: "messages.0.content.2.image.source.url: ...")
+BLOCO_IMAGEM_ERRO_RE = re.compile(r'content\.(\d+)\.image')
+
+
+def _url_bloqueada_para_fetcher(url: str) -> bool:
     """
-    Verifica se a URL aponta para o CDN publico da Alura, comparando o hostname
-    real (nao substring). URLs como https://www.alura.com.br/_next/image?url=...
-    contem o dominio do CDN no query string, mas sao servidas por www.alura.com.br,
-    cujo robots.txt bloqueia /_next/ e faz a API da Anthropic recusar a imagem.
+    Verifica se a URL e sabidamente recusada pelo fetcher da Anthropic,
+    comparando o hostname real (nao substring). URLs como
+    https://www.alura.com.br/_next/image?url=... contem o dominio do CDN no
+    query string, mas sao servidas por www.alura.com.br, cujo robots.txt
+    bloqueia /_next/ e faz a API da Anthropic recusar a imagem.
+    SVG tambem vai pelo base64: a API nao aceita SVG e o download local
+    rasteriza para PNG.
     """
     try:
-        host = (urlparse(url).hostname or '').lower()
+        partes = urlparse(url)
     except Exception:
+        return True
+    if partes.path.lower().endswith('.svg'):
+        return True
+    host = (partes.hostname or '').lower()
+    return host in ('www.alura.com.br', 'alura.com.br') and partes.path.startswith('/_next/')
+
+
+def _url_recusada(url: str) -> bool:
+    """Indica se o fetcher do provedor recusou a URL recentemente."""
+    with _urls_recusadas_lock:
+        expira_em = _urls_recusadas.get(url)
+        if expira_em is None:
+            return False
+        if expira_em < time.monotonic():
+            del _urls_recusadas[url]
+            return False
+        _urls_recusadas.move_to_end(url)
+        return True
+
+
+def _marcar_url_recusada(url: str):
+    """Memoriza a URL como recusada por URLS_RECUSADAS_TTL segundos."""
+    with _urls_recusadas_lock:
+        _urls_recusadas[url] = time.monotonic() + URLS_RECUSADAS_TTL
+        _urls_recusadas.move_to_end(url)
+        while len(_urls_recusadas) > URLS_RECUSADAS_MAX_ITEMS:
+            _urls_recusadas.popitem(last=False)
+
+
+def _content_type_aceito(response, url: str) -> bool:
+    """
+    Indica se o content-type da resposta e um formato que a API aceita por
+    URL (MEDIA_TYPE_MAP). Sem content-type, deixa a API decidir.
+    """
+    content_type = response.headers.get('content-type', '').partition(';')[0].strip().lower()
+    if content_type and content_type not in MEDIA_TYPE_MAP:
+        print(f"AVISO: Formato {content_type} nao aceito por URL, enviando como base64: {url}")
         return False
-    return host in ('cdn-wcsm.alura.com.br', 'cdn.alura.com.br')
+    return True
 
 
-def _verificar_tamanho_imagem_url(url: str) -> bool:
+def _verificar_imagem_url(url: str) -> str:
     """
-    Verifica se imagem em URL esta dentro do limite (~3.75MB original = 5MB base64).
-    Usa HEAD request primeiro, fallback para GET parcial.
-    Retorna True se OK, False se excede ou falha.
+    Verifica se imagem em URL pode ir como URL direta para a API.
+    Usa HEAD request primeiro, fallback para GET parcial. Retorna:
+    - 'url': dentro do limite (~3.75MB original = 5MB base64)
+    - 'grande': tamanho confirmado acima do limite (imagem ignorada)
+    - 'base64': a verificacao falhou (status 4xx/5xx, timeout, erro de
+      conexao) ou o content-type nao e aceito pela API (ex: SVG sem
+      extensao .svg, como badges do shields.io); o download local como
+      base64 ainda pode funcionar e rasteriza SVG para PNG
     """
     try:
         # Tenta HEAD primeiro (mais rapido)
         response = httpx.head(url, timeout=10, follow_redirects=True)
+        if response.status_code >= 400:
+            print(f"AVISO: HEAD {response.status_code} na imagem, enviando como base64: {url}")
+            return 'base64'
+        if not _content_type_aceito(response, url):
+            return 'base64'
         content_length = response.headers.get('content-length')
 
         if content_length:
@@ -54,61 +176,95 @@ def _verificar_tamanho_imagem_url(url: str) -> bool:
                 size_mb = size / (1024 * 1024)
                 estimated_base64_mb = (size * 4 / 3) / (1024 * 1024)
                 print(f"🚫 Imagem ignorada via HEAD ({size_mb:.1f}MB -> ~{estimated_base64_mb:.1f}MB base64): {url}")
-                return False
-            return True
+                return 'grande'
+            return 'url'
 
         # Se HEAD nao retornou content-length, faz GET com stream
         with httpx.stream("GET", url, timeout=30, follow_redirects=True) as response:
             response.raise_for_status()
+            if not _content_type_aceito(response, url):
+                return 'base64'
             size = 0
             for chunk in response.iter_bytes(chunk_size=1024 * 64):
                 size += len(chunk)
                 if size > MAX_IMAGE_SIZE_ORIGINAL:
                     size_mb = size / (1024 * 1024)
                     print(f"🚫 Imagem ignorada via GET (>{size_mb:.1f}MB): {url}")
-                    return False
-            return True
+                    return 'grande'
+            return 'url'
 
     except Exception as e:
-        print(f"AVISO: Erro ao verificar tamanho de imagem {url}: {e}")
-        return False
+        print(f"AVISO: Erro ao verificar imagem {url}, enviando como base64: {e}")
+        return 'base64'
 
 
 def _carregar_imagem_como_base64(url: str) -> tuple:
     """
-    Carrega imagem de URL e retorna (base64_data, media_type).
+    Carrega imagem de URL e retorna (base64_data, media_type), com cache LRU
+    por URL. Os agentes de uma mesma revisao compartilham a lista de imagens,
+    entao download e encoding acontecem uma vez por imagem.
+    Falhas nao sao cacheadas (podem ser transitorias).
+    """
+    global _image_cache_bytes
+
+    with _image_cache_lock:
+        cached = _image_cache.get(url)
+        if cached is not None:
+            _image_cache.move_to_end(url)
+            return cached
+
+    base64_data, media_type = _baixar_imagem_como_base64(url)
+    if not base64_data:
+        return base64_data, media_type
+
+    with _image_cache_lock:
+        if url not in _image_cache:
+            _image_cache[url] = (base64_data, media_type)
+            _image_cache_bytes += len(base64_data)
+            while _image_cache_bytes > IMAGE_CACHE_MAX_BYTES and len(_image_cache) > 1:
+                _, (antigo, _) = _image_cache.popitem(last=False)
+                _image_cache_bytes -= len(antigo)
+
+    return base64_data, media_type
+
+
+def _baixar_imagem_como_base64(url: str) -> tuple:
+    """
+    Baixa imagem de URL e retorna (base64_data, media_type).
     Retorna (None, None) se falhar ou se imagem exceder 5MB.
     """
-    print(f"🔄 _carregar_imagem_como_base64 v2: {url}")
+    print(f"🔄 _baixar_imagem_como_base64: {url}")
     try:
-        response = httpx.get(url, timeout=30, follow_redirects=True)
-        response.raise_for_status()
-
-        size_bytes = len(response.content)
+        # Baixa em streaming para um unico buffer, abortando assim que o
+        # tamanho passar do limite (nao precisa baixar a imagem inteira)
+        conteudo = io.BytesIO()
+        with _http_client.stream("GET", url, timeout=30) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('content-type', 'image/jpeg')
+            for chunk in response.iter_bytes(chunk_size=64 * 1024):
+                conteudo.write(chunk)
+                if conteudo.tell() > MAX_IMAGE_SIZE_ORIGINAL:
+                    size_mb = conteudo.tell() / (1024 * 1024)
+                    print(f"🚫 IGNORANDO (base64 excederia 5MB, >{size_mb:.2f}MB original): {url}")
+                    return None, None
+
+        size_bytes = conteudo.tell()
         size_mb = size_bytes / (1024 * 1024)
         # Base64 aumenta ~33%, entao estimamos o tamanho final
         estimated_base64_size = int(size_bytes * 4 / 3)
         estimated_base64_mb = estimated_base64_size / (1024 * 1024)
         print(f"📦 Tamanho: {size_mb:.2f}MB original -> ~{estimated_base64_mb:.2f}MB base64")
-
-        # Verifica se o tamanho original vai exceder 5MB apos base64
-        if size_bytes > MAX_IMAGE_SIZE_ORIGINAL:
-            print(f"🚫 IGNORANDO (base64 excederia 5MB: {estimated_base64_mb:.2f}MB): {url}")
-            return None, None
-
         print(f"✅ Imagem OK: {size_mb:.2f}MB -> ~{estimated_base64_mb:.2f}MB base64")
 
-        content_type = response.headers.get('content-type', 'image/jpeg')
-        if ';' in content_type:
-            content_type = content_type.split(';')[0].strip()
+        content_type = content_type.partition(';')[0].strip()
 
         # SVG: rasteriza para PNG antes de enviar (APIs nao suportam SVG)
         if content_type == 'image/svg+xml' or url.lower().endswith('.svg'):
             try:
                 import cairosvg
                 print(f"🔄 Rasterizando SVG -> PNG (cairosvg): {url}")
-                png_bytes = cairosvg.svg2png(bytestring=response.content)
-                base64_data = base64.b64encode(png_bytes).decode('utf-8')
+                png_bytes = cairosvg.svg2png(bytestring=conteudo.getvalue())
+                base64_data = base64.b64encode(png_bytes).decode('ascii')
                 print(f"✅ SVG rasterizado: {len(png_bytes) / (1024*1024):.2f}MB PNG")
                 return base64_data, 'image/png'
             except Exception as e:
@@ -116,22 +272,17 @@ def _carregar_imagem_como_base64(url: str) -> tuple:
                 return None, None
 
         # Mapeia content-type para media_type valido
-        media_type_map = {
-            'image/jpeg': 'image/jpeg',
-            'image/jpg': 'image/jpeg',
-            'image/png': 'image/png',
-            'image/gif': 'image/gif',
-            'image/webp': 'image/webp',
-        }
-        media_type = media_type_map.get(content_type)
+        media_type = MEDIA_TYPE_MAP.get(content_type)
         if not media_type:
             print(f"⚠️ IGNORANDO formato nao suportado ({content_type}): {url}")
             return None, None
 
-        image_bytes = response.content
+        # Sem copia: o buffer do download e usado direto (resize troca por bytes novos)
+        image_bytes = conteudo.getbuffer()
         # Redimensiona se alguma dimensao exceder o limite para multiplas imagens
         try:
-            img = PILImage.open(io.BytesIO(image_bytes))
+            conteudo.seek(0)
+            img = PILImage.open(conteudo)
             w, h = img.size
             if w > MAX_IMAGE_DIMENSION or h > MAX_IMAGE_DIMENSION:
                 scale = MAX_IMAGE_DIMENSION / max(w, h)
@@ -145,64 +296,190 @@ def _carregar_imagem_como_base64(url: str) -> tuple:
         except Exception as resize_err:
             print(f"⚠️ Falha ao redimensionar imagem, usando original: {resize_err}")
 
-        base64_data = base64.b64encode(image_bytes).decode('utf-8')
+        base64_data = base64.b64encode(image_bytes).decode('ascii')
         return base64_data, media_type
     except Exception as e:
         print(f"Erro ao carregar imagem {url}: {e}")
         return None, None
 
 
-class LLMClient(ABC):
-    """Interface base para clientes de LLM."""
+def _chave_resposta(*partes) -> str:
+    """Hash dos prompts/parametros de uma chamada (chave do cache de respostas)."""
+    h = hashlib.blake2b(digest_size=16)
+    for parte in partes:
+        h.update(str(parte or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def _obter_resposta_em_cache(chave: str):
+    """Retorna a resposta em cache para a chave, ou None se ausente/expirada."""
+    with _response_cache_lock:
+        item = _response_cache.get(chave)
+        if item is None:
+            return None
+        expira_em, resposta = item
+        if expira_em < time.monotonic():
+            del _response_cache[chave]
+            return None
+        _response_cache.move_to_end(chave)
+        return resposta
+
+
+def _guardar_resposta_em_cache(chave: str, resposta: str):
+    """Guarda a resposta por RESPONSE_CACHE_TTL segundos (respostas vazias nao)."""
+    if not resposta:
+        return
+    with _response_cache_lock:
+        _response_cache[chave] = (time.monotonic() + RESPONSE_CACHE_TTL, resposta)
+        _response_cache.move_to_end(chave)
+        while len(_response_cache) > RESPONSE_CACHE_MAX_ITEMS:
+            _response_cache.popitem(last=False)
+
+
+def _obter_http_client_sdk(provedor: str, fabrica):
+    """
+    Retorna o cliente HTTP compartilhado do SDK do provedor, criando-o na
+    primeira chamada. O segundo valor indica se o cliente acabou de ser criado.
+    """
+    with _sdk_http_clients_lock:
+        cliente = _sdk_http_clients.get(provedor)
+        if cliente is not None:
+            return cliente, False
+        cliente = _sdk_http_clients[provedor] = fabrica()
+        return cliente, True
 
-    @abstractmethod
-    def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
-        """Gera uma resposta do modelo."""
-        pass
 
-    def gerar_resposta_com_busca(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
-        """Gera resposta com capacidade de busca web. Fallback para gerar_resposta."""
-        return self.gerar_resposta(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+def _pre_aquecer_conexao(cliente, url: str):
+    """
+    Dispara um HEAD em background para abrir TCP+TLS com a API antes da
+    primeira chamada ao modelo. Falhas sao ignoradas: e so otimizacao.
+    """
+    def _head():
+        try:
+            cliente.head(url, timeout=5)
+        except Exception:
+            pass
 
-    def gerar_resposta_com_imagens(
-        self,
-        system_prompt: str,
-        user_prompt: str,
-        imagens: list,
-        max_tokens: int = 32000,
-        artigo_context: str = None
-    ) -> str:
-        """
-        Gera resposta analisando imagens (visao multimodal).
+    threading.Thread(target=_head, daemon=True).start()
 
-        Args:
-            system_prompt: Prompt do sistema
-            user_prompt: Prompt do usuario
-            imagens: Lista de dicts com {url, alt?}
-            max_tokens: Limite de tokens
-            artigo_context: Conteudo do artigo para cache
 
-        Returns:
-            Resposta do modelo
-        """
-        # Fallback padrao: ignora imagens e usa texto
-        print("AVISO: gerar_resposta_com_imagens nao implementado, usando texto apenas")
-        return self.gerar_resposta(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+def _pre_aquecer_conexao_async(cliente, url: str):
+    """
+    Versao de _pre_aquecer_conexao para o httpx.AsyncClient dos clientes
+    assincronos: agenda o HEAD como tarefa no event loop atual. Sem loop
+    rodando (ex: cliente criado fora de um endpoint) nao faz nada.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
 
-    def gerar_resposta_com_imagens_e_busca(
-        self,
-        system_prompt: str,
-        user_prompt: str,
-        imagens: list,
-        max_tokens: int = 32000,
-        artigo_context: str = None,
-        forcar_base64: bool = False
-    ) -> str:
-        """
-        Gera resposta com visao multimodal E busca web.
-        Fallback para gerar_resposta_com_imagens.
-        """
-        return self.gerar_resposta_com_imagens(system_prompt, user_prompt, imagens, max_tokens, artigo_context=artigo_context)
+    async def _head():
+        try:
+            await cliente.head(url, timeout=5)
+        except Exception:
+            pass
+
+    tarefa = loop.create_task(_head())
+    _tarefas_pre_aquecimento.add(tarefa)
+    tarefa.add_done_callback(_tarefas_pre_aquecimento.discard)
+
+
+def _json_loads(texto: str):
+    """
+    json.loads acelerado por orjson quando disponivel.
+    Se o orjson recusar algo que o json aceita (NaN, inteiros enormes),
+    refaz o parse com o json para nao perder revisoes.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(texto)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(texto)
+
+
+def _fechamentos_json(texto: str, inicio: int = 0):
+    """
+    Percorre texto a partir de inicio e gera (indice, caractere, profundidade)
+    para cada ']' ou '}' fora de strings JSON, com a profundidade ja
+    decrementada (0 = fechou o bloco aberto no nivel mais externo).
+    Salta direto entre delimitadores via regex, sem backtracking.
+    """
+    profundidade = 0
+    em_string = False
+    escapado = -1
+    for m in DELIMITADOR_JSON_RE.finditer(texto, inicio):
+        i = m.start()
+        if i == escapado:
+            continue
+        ch = texto[i]
+        if em_string:
+            if ch == '\\':
+                escapado = i + 1
+            elif ch == '"':
+                em_string = False
+        elif ch == '"':
+            em_string = True
+        elif ch in '[{':
+            profundidade += 1
+        elif ch != '\\':
+            profundidade -= 1
+            yield i, ch, profundidade
+
+
+def _fim_bloco_json(texto: str, inicio: int) -> int:
+    """
+    Retorna o indice do ']' ou '}' que fecha o bloco aberto em texto[inicio],
+    ignorando delimitadores dentro de strings JSON. Retorna -1 se o bloco nao
+    fecha (ex: resposta truncada).
+    """
+    for i, _, profundidade in _fechamentos_json(texto, inicio):
+        if profundidade == 0:
+            return i
+    return -1
+
+
+def _fim_ultimo_objeto_completo(texto: str, profundidade_base: int = 1) -> int:
+    """
+    Retorna o indice do '}' que fecha o ultimo objeto completo no nivel
+    profundidade_base (1 = elementos de um array iniciado em texto[0]).
+    Ignora delimitadores dentro de strings JSON, entao um objeto final
+    truncado ou com string aberta nunca e confundido com um completo.
+    Retorna -1 se nenhum objeto fecha nesse nivel.
+    """
+    ultimo = -1
+    for i, ch, profundidade in _fechamentos_json(texto):
+        if ch == '}' and profundidade == profundidade_base:
+            ultimo = i
+    return ultimo
+
+
+def _encontrar_array_json(texto: str):
+    """
+    Localiza o array JSON de revisoes na resposta em uma unica passada.
+    Prefere o primeiro array que comeca com objeto (ou vazio), pulando trechos
+    como "[P3]" no texto livre. Se o array nao fecha, retorna do '[' ate o fim
+    para que o reparo por truncamento ainda funcione. Retorna None sem '['.
+    """
+    primeiro = None
+    inicio = texto.find('[')
+    while inicio >= 0:
+        fim = _fim_bloco_json(texto, inicio)
+        trecho = texto[inicio:fim + 1] if fim >= 0 else texto[inicio:]
+        if INICIO_ARRAY_REVISOES_RE.match(texto, inicio):
+            return trecho
+        if primeiro is None:
+            primeiro = trecho
+        if fim < 0:
+            break
+        inicio = texto.find('[', fim + 1)
+    return primeiro
+
+
+class _ExtratorJSONMixin:
+    """Extracao do JSON de revisoes, comum aos clientes sincronos e assincronos."""
 
     def extrair_json(self, resposta: str) -> list:
         """
@@ -216,51 +493,69 @@ class LLMClient(ABC):
             return []
 
         resposta = resposta.strip()
-        print(f"🔎 extrair_json: resposta tem {len(resposta)} chars")
+        if EXTRAIR_JSON_DEBUG:
+            print(f"🔎 extrair_json: resposta tem {len(resposta)} chars")
+
+        def _filtrar_dicts(items: list) -> list:
+            """Filtra apenas dicts validos da lista."""
+            filtered = list(filter(dict.__instancecheck__, items))
+            if EXTRAIR_JSON_DEBUG:
+                print(f"🔎 _filtrar_dicts: {len(items)} items -> {len(filtered)} dicts")
+            return filtered
+
+        # Caminho rapido: resposta ja e um array JSON limpo (caso comum)
+        if resposta[:1] == '[' and resposta[-1:] == ']':
+            try:
+                result = _json_loads(resposta)
+                if isinstance(result, list):
+                    if EXTRAIR_JSON_DEBUG:
+                        print(f"🔎 Parse direto OK: {len(result)} items")
+                    return _filtrar_dicts(result)
+            except json.JSONDecodeError:
+                pass
 
         # Remove markdown code fences (```json ... ``` ou ``` ... ```)
         if resposta.startswith('```'):
-            resposta = re.sub(r'^```\w*\s*\n?', '', resposta)
-            resposta = re.sub(r'\n?```\s*$', '', resposta)
+            resposta = FENCE_ABERTURA_RE.sub('', resposta, count=1)
+            resposta = FENCE_FECHAMENTO_RE.sub('', resposta, count=1)
             resposta = resposta.strip()
-            print(f"🔎 Apos remover fences: {len(resposta)} chars")
+            if EXTRAIR_JSON_DEBUG:
+                print(f"🔎 Apos remover fences: {len(resposta)} chars")
 
         # Extrai o conteudo do array JSON
         json_text = resposta
-        json_match = re.search(r'\[[\s\S]*\]', resposta)
-        if json_match:
-            json_text = json_match.group()
-            print(f"🔎 Array JSON encontrado: {len(json_text)} chars")
-        else:
+        array_text = _encontrar_array_json(resposta)
+        if array_text is not None:
+            json_text = array_text
+            if EXTRAIR_JSON_DEBUG:
+                print(f"🔎 Array JSON encontrado: {len(json_text)} chars")
+        elif EXTRAIR_JSON_DEBUG:
             print(f"🔎 Nenhum array JSON encontrado, usando resposta completa")
 
-        def _filtrar_dicts(items: list) -> list:
-            """Filtra apenas dicts validos da lista."""
-            filtered = [item for item in items if isinstance(item, dict)]
-            print(f"🔎 _filtrar_dicts: {len(items)} items -> {len(filtered)} dicts")
-            return filtered
-
         # Tentativa 1: parse direto
         try:
-            result = json.loads(json_text)
+            result = _json_loads(json_text)
             if isinstance(result, list):
-                print(f"🔎 Parse direto OK: {len(result)} items")
+                if EXTRAIR_JSON_DEBUG:
+                    print(f"🔎 Parse direto OK: {len(result)} items")
                 return _filtrar_dicts(result)
-            else:
+            elif EXTRAIR_JSON_DEBUG:
                 print(f"🔎 Parse direto: resultado nao e lista, e {type(result).__name__}")
         except json.JSONDecodeError as e:
-            print(f"🔎 Parse direto falhou: {e}")
+            if EXTRAIR_JSON_DEBUG:
+                print(f"🔎 Parse direto falhou: {e}")
 
         # Tentativa 2: truncar no ultimo objeto completo e fechar array
         # (recupera tudo antes do ponto com erro)
         try:
-            last_brace = json_text.rfind('}')
+            em_array = json_text.startswith('[')
+            last_brace = _fim_ultimo_objeto_completo(json_text, 1 if em_array else 0)
             if last_brace > 0:
                 truncated = json_text[:last_brace + 1]
-                if not truncated.lstrip().startswith('['):
+                if not em_array:
                     truncated = '[' + truncated
-                truncated = truncated.rstrip().rstrip(',') + ']'
-                result = json.loads(truncated)
+                truncated = truncated + ']'
+                result = _json_loads(truncated)
                 if isinstance(result, list) and result:
                     filtered = _filtrar_dicts(result)
                     if filtered:
@@ -269,17 +564,25 @@ class LLMClient(ABC):
         except json.JSONDecodeError:
             pass
 
-        # Tentativa 3: extrair objetos individuais com regex
-        # (recupera cada objeto valido, ignora os malformados)
+        # Tentativa 3: extrair objetos individuais balanceando chaves
+        # (recupera cada objeto valido, ignora os malformados; aceita objetos
+        # com chaves aninhadas ou '{' '}' dentro de strings)
         objects = []
-        # Busca blocos {...} que contenham campos de revisao
-        for m in re.finditer(r'\{[^{}]*"acao"\s*:[^{}]*\}', json_text):
-            try:
-                obj = json.loads(m.group())
-                if isinstance(obj, dict):
+        inicio = json_text.find('{')
+        while inicio >= 0:
+            fim = _fim_bloco_json(json_text, inicio)
+            proximo = inicio + 1
+            if fim >= 0:
+                try:
+                    obj = _json_loads(json_text[inicio:fim + 1])
+                except json.JSONDecodeError:
+                    obj = None
+                # Busca blocos {...} que contenham campos de revisao; se o bloco
+                # nao e uma revisao, procura revisoes aninhadas dentro dele
+                if isinstance(obj, dict) and 'acao' in obj:
                     objects.append(obj)
-            except json.JSONDecodeError:
-                continue
+                    proximo = fim + 1
+            inicio = json_text.find('{', proximo)
 
         if objects:
             print(f"JSON reparado (individual): {len(objects)} revisoes recuperadas")
@@ -290,23 +593,109 @@ class LLMClient(ABC):
         return []
 
 
-class AnthropicClient(LLMClient):
-    """Cliente para API da Anthropic (Claude)."""
+class LLMClient(_ExtratorJSONMixin, ABC):
+    """Interface base para clientes de LLM."""
 
-    def __init__(self, model: str = None):
-        import anthropic
-        self.client = anthropic.Anthropic(max_retries=10)
-        self.model = model or os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-5-20250929")
+    @abstractmethod
+    def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        """Gera uma resposta do modelo."""
+        pass
+
+    def gerar_resposta_com_busca(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        """Gera resposta com capacidade de busca web. Fallback para gerar_resposta."""
+        return self.gerar_resposta(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+
+    def gerar_resposta_com_imagens(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        imagens: list,
+        max_tokens: int = 32000,
+        artigo_context: str = None
+    ) -> str:
+        """
+        Gera resposta analisando imagens (visao multimodal).
+
+        Args:
+            system_prompt: Prompt do sistema
+            user_prompt: Prompt do usuario
+            imagens: Lista de dicts com {url, alt?}
+            max_tokens: Limite de tokens
+            artigo_context: Conteudo do artigo para cache
+
+        Returns:
+            Resposta do modelo
+        """
+        # Fallback padrao: ignora imagens e usa texto
+        print("AVISO: gerar_resposta_com_imagens nao implementado, usando texto apenas")
+        return self.gerar_resposta(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+
+    def gerar_resposta_com_imagens_e_busca(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        imagens: list,
+        max_tokens: int = 32000,
+        artigo_context: str = None,
+        forcar_base64: bool = False
+    ) -> str:
+        """
+        Gera resposta com visao multimodal E busca web.
+        Fallback para gerar_resposta_com_imagens.
+        """
+        return self.gerar_resposta_com_imagens(system_prompt, user_prompt, imagens, max_tokens, artigo_context=artigo_context)
+
+    def registrar_urls_recusadas(self, erro: Exception) -> list:
+        """
+        Memoriza as URLs de imagem que o fetcher do provedor recusou, a partir
+        do erro da ultima requisicao com imagens. Padrao: nada a memorizar.
+        """
+        return []
+
+
+class _SystemAnthropicMixin:
+    """System prompt no formato da Anthropic (clientes sincrono e assincrono)."""
 
     def _build_system(self, system_prompt: str, artigo_context: str = None):
-        """Monta system prompt com cache_control quando artigo_context fornecido."""
+        """
+        Monta system prompt com cache_control quando artigo_context fornecido.
+        Dois breakpoints: o artigo (compartilhado entre os agentes SEO, TECNICO
+        e TEXTO) e artigo + instrucoes do agente (reaproveitado quando o mesmo
+        agente roda de novo no artigo, ex: retry ou versao -form).
+        """
         if artigo_context:
             return [
                 {"type": "text", "text": artigo_context, "cache_control": {"type": "ephemeral"}},
-                {"type": "text", "text": system_prompt}
+                {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
             ]
         return system_prompt
 
+
+class _SystemOpenAIMixin:
+    """System prompt no formato da OpenAI (clientes sincrono e assincrono)."""
+
+    def _build_system(self, system_prompt: str, artigo_context: str = None) -> str:
+        """Monta system prompt com artigo_context como prefixo (cache automatico da OpenAI)."""
+        if artigo_context:
+            return f"{artigo_context}\n\n---\n\n{system_prompt}"
+        return system_prompt
+
+
+class AnthropicClient(_SystemAnthropicMixin, LLMClient):
+    """Cliente para API da Anthropic (Claude)."""
+
+    # URL de cada bloco de imagem da ultima mensagem montada (None nos blocos
+    # base64), na ordem do content; usado por registrar_urls_recusadas
+    _urls_por_bloco = ()
+
+    def __init__(self, model: str = None):
+        import anthropic
+        http_client, novo = _obter_http_client_sdk("anthropic", anthropic.DefaultHttpxClient)
+        self.client = anthropic.Anthropic(max_retries=10, http_client=http_client)
+        self.model = model or os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-5-20250929")
+        if novo:
+            _pre_aquecer_conexao(http_client, str(self.client.base_url))
+
     def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
         with self.client.messages.stream(
             model=self.model,
@@ -330,23 +719,39 @@ class AnthropicClient(LLMClient):
     def _preparar_imagens_para_mensagem(self, imagens: list, forcar_base64: bool = False) -> list:
         """
         Prepara lista de imagens para o formato de mensagem da Anthropic.
-        Tenta usar URL direta para cdn-wcsm.alura.com.br, fallback para base64.
+        Usa URL direta para imagens http(s), fallback para base64 nas URLs
+        bloqueadas ou ja recusadas pelo fetcher da Anthropic.
 
         forcar_base64=True baixa todas as imagens localmente, contornando
         qualquer restricao do fetcher da Anthropic (robots.txt, 403, timeout).
         """
         content_blocks = []
+        urls_por_bloco = []
+        # Mesma imagem repetida no artigo (ex: thumbnail tambem usada inline)
+        # e baixada/enviada uma unica vez; o prompt ja lista cada ocorrencia
+        urls_vistas = set()
 
         for img in imagens:
             url = img.get('url', '')
-            if not url:
+            if not url or url in urls_vistas:
                 continue
-
-            # Tenta usar URL direta para CDN da Alura (imagens publicas)
-            if _e_url_cdn_publica(url) and not forcar_base64:
-                # Verifica tamanho antes de incluir (limite 5MB da API)
-                if not _verificar_tamanho_imagem_url(url):
+            urls_vistas.add(url)
+
+            # Tenta usar URL direta (o fetcher da Anthropic aceita qualquer URL publica)
+            envio = 'base64'
+            if (
+                not forcar_base64
+                and url.startswith(('http://', 'https://'))
+                and not _url_bloqueada_para_fetcher(url)
+                and not _url_recusada(url)
+            ):
+                # Verifica tamanho antes de incluir (limite 5MB da API); se a
+                # verificacao falhar, a imagem ainda vai pelo base64
+                envio = _verificar_imagem_url(url)
+                if envio == 'grande':
                     continue
+
+            if envio == 'url':
                 content_blocks.append({
                     "type": "image",
                     "source": {
@@ -354,6 +759,7 @@ class AnthropicClient(LLMClient):
                         "url": url
                     }
                 })
+                urls_por_bloco.append(url)
             else:
                 # Fallback: carrega como base64
                 base64_data, media_type = _carregar_imagem_como_base64(url)
@@ -366,11 +772,34 @@ class AnthropicClient(LLMClient):
                             "data": base64_data
                         }
                     })
+                    urls_por_bloco.append(None)
                 else:
                     print(f"AVISO: Imagem ignorada (falha ao carregar): {url}")
 
+        self._urls_por_bloco = urls_por_bloco
         return content_blocks
 
+    def registrar_urls_recusadas(self, erro: Exception) -> list:
+        """
+        Memoriza como recusadas so as URLs que o erro da API cita, pela propria
+        URL ou pela posicao do bloco ("messages.0.content.N.image..."; o
+        content[0] e o texto do prompt). Retorna as URLs memorizadas.
+        """
+        msg = str(erro)
+        recusadas = [url for url in self._urls_por_bloco if url and url in msg]
+        for m in BLOCO_IMAGEM_ERRO_RE.finditer(msg):
+            k = int(m.group(1)) - 1
+            if 0 <= k < len(self._urls_por_bloco):
+                url = self._urls_por_bloco[k]
+                if url and url not in recusadas:
+                    recusadas.append(url)
+
+        for url in recusadas:
+            _marcar_url_recusada(url)
+        if recusadas:
+            print(f"🚫 {len(recusadas)} URL(s) de imagem recusada(s) pelo fetcher, proximas vao como base64")
+        return recusadas
+
     def gerar_resposta_com_imagens(
         self,
         system_prompt: str,
@@ -422,19 +851,16 @@ class AnthropicClient(LLMClient):
             return stream.get_final_text()
 
 
-class OpenAIClient(LLMClient):
+class OpenAIClient(_SystemOpenAIMixin, LLMClient):
     """Cliente para API da OpenAI (GPT)."""
 
     def __init__(self, model: str = None):
-        from openai import OpenAI
-        self.client = OpenAI()
+        from openai import OpenAI, DefaultHttpxClient
+        http_client, novo = _obter_http_client_sdk("openai", DefaultHttpxClient)
+        self.client = OpenAI(http_client=http_client)
         self.model = model or os.getenv("OPENAI_MODEL", "gpt-4.1")
-
-    def _build_system(self, system_prompt: str, artigo_context: str = None) -> str:
-        """Monta system prompt com artigo_context como prefixo (cache automatico da OpenAI)."""
-        if artigo_context:
-            return f"{artigo_context}\n\n---\n\n{system_prompt}"
-        return system_prompt
+        if novo:
+            _pre_aquecer_conexao(http_client, str(self.client.base_url))
 
     def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
         response = self.client.chat.completions.create(
@@ -456,11 +882,15 @@ class OpenAIClient(LLMClient):
         restricoes do fetcher da OpenAI (robots.txt, 403, timeout).
         """
         image_contents = []
+        # Mesma imagem repetida no artigo (ex: thumbnail tambem usada inline)
+        # e baixada/enviada uma unica vez; o prompt ja lista cada ocorrencia
+        urls_vistas = set()
 
         for img in imagens:
             url = img.get('url', '')
-            if not url:
+            if not url or url in urls_vistas:
                 continue
+            urls_vistas.add(url)
 
             # OpenAI suporta URL direta para imagens publicas
             if url.startswith('http') and not forcar_base64:
@@ -475,7 +905,7 @@ class OpenAIClient(LLMClient):
                     image_contents.append({
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:{media_type};base64,{base64_data}"
+                            "url": "data:" + media_type + ";base64," + base64_data
                         }
                     })
                 else:
@@ -529,6 +959,108 @@ class OpenAIClient(LLMClient):
         )
 
 
+class AsyncLLMClient(_ExtratorJSONMixin, ABC):
+    """
+    Interface assincrona para clientes de LLM.
+    Permite que chamadas independentes (ex: agentes SEO, TECNICO e TEXTO do
+    mesmo artigo) se sobreponham no event loop em vez de bloquea-lo.
+    """
+
+    @abstractmethod
+    async def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        """Gera uma resposta do modelo."""
+        pass
+
+    async def gerar_resposta_com_busca(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        """Gera resposta com capacidade de busca web. Fallback para gerar_resposta."""
+        return await self.gerar_resposta(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+
+    async def gerar_resposta_com_cache(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int = 32000,
+        artigo_context: str = None,
+        busca: bool = False
+    ) -> str:
+        """
+        gerar_resposta (ou gerar_resposta_com_busca, se busca=True) passando
+        pelo cache de respostas. Com LLM_RESPONSE_CACHE_TTL=0 (padrao) chama
+        o modelo direto.
+        """
+        gerar = self.gerar_resposta_com_busca if busca else self.gerar_resposta
+        if RESPONSE_CACHE_TTL <= 0:
+            return await gerar(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+
+        chave = _chave_resposta(
+            type(self).__name__, self.model, busca, max_tokens,
+            system_prompt, artigo_context, user_prompt
+        )
+        resposta = _obter_resposta_em_cache(chave)
+        if resposta is not None:
+            print(f"♻️ Resposta do LLM em cache ({type(self).__name__}, {self.model})")
+            return resposta
+
+        resposta = await gerar(system_prompt, user_prompt, max_tokens, artigo_context=artigo_context)
+        _guardar_resposta_em_cache(chave, resposta)
+        return resposta
+
+
+class AsyncAnthropicClient(_SystemAnthropicMixin, AsyncLLMClient):
+    """Cliente assincrono para API da Anthropic (Claude)."""
+
+    def __init__(self, model: str = None):
+        import anthropic
+        http_client, novo = _obter_http_client_sdk("anthropic_async", anthropic.DefaultAsyncHttpxClient)
+        self.client = anthropic.AsyncAnthropic(max_retries=10, http_client=http_client)
+        self.model = model or os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-5-20250929")
+        if novo:
+            _pre_aquecer_conexao_async(http_client, str(self.client.base_url))
+
+    async def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        async with self.client.messages.stream(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=self._build_system(system_prompt, artigo_context),
+            messages=[{"role": "user", "content": user_prompt}]
+        ) as stream:
+            return await stream.get_final_text()
+
+    async def gerar_resposta_com_busca(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        """Gera resposta com web search habilitado (server-side tool da Anthropic)."""
+        async with self.client.messages.stream(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=self._build_system(system_prompt, artigo_context),
+            tools=[{"type": "web_search_20250305", "name": "web_search"}],
+            messages=[{"role": "user", "content": user_prompt}]
+        ) as stream:
+            return await stream.get_final_text()
+
+
+class AsyncOpenAIClient(_SystemOpenAIMixin, AsyncLLMClient):
+    """Cliente assincrono para API da OpenAI (GPT)."""
+
+    def __init__(self, model: str = None):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        http_client, novo = _obter_http_client_sdk("openai_async", DefaultAsyncHttpxClient)
+        self.client = AsyncOpenAI(http_client=http_client)
+        self.model = model or os.getenv("OPENAI_MODEL", "gpt-4.1")
+        if novo:
+            _pre_aquecer_conexao_async(http_client, str(self.client.base_url))
+
+    async def gerar_resposta(self, system_prompt: str, user_prompt: str, max_tokens: int = 32000, artigo_context: str = None) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            max_completion_tokens=max_tokens,
+            messages=[
+                {"role": "system", "content": self._build_system(system_prompt, artigo_context)},
+                {"role": "user", "content": user_prompt}
+            ]
+        )
+        return response.choices[0].message.content
+
+
 def criar_cliente_llm(provider: str = None, model: str = None) -> LLMClient:
     """
     Cria um cliente LLM baseado no provedor especificado.
@@ -548,3 +1080,25 @@ def criar_cliente_llm(provider: str = None, model: str = None) -> LLMClient:
         return OpenAIClient(model)
     else:
         raise ValueError(f"Provedor desconhecido: {provider}. Use 'anthropic' ou 'openai'.")
+
+
+def criar_cliente_llm_async(provider: str = None, model: str = None) -> AsyncLLMClient:
+    """
+    Cria um cliente LLM assincrono baseado no provedor especificado.
+    Use com await (ex: asyncio.gather) para sobrepor chamadas independentes.
+
+    Args:
+        provider: "anthropic" ou "openai". Se None, usa LLM_PROVIDER do ambiente.
+        model: Modelo especifico. Se None, usa padrao do provedor.
+
+    Returns:
+        Instancia de AsyncLLMClient
+    """
+    provider = provider or os.getenv("LLM_PROVIDER", "anthropic")
+
+    if provider.lower() == "anthropic":
+        return AsyncAnthropicClient(model)
+    elif provider.lower() == "openai":
+        return AsyncOpenAIClient(model)
+    else:
+        raise ValueError(f"Provedor desconhecido: {provider}. Use 'anthropic' ou 'openai'.")
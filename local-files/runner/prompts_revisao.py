@@ -2,7 +2,58 @@
 Prompts para os agentes de revisao de artigos.
 Cada agente tem um foco especifico: SEO, TECNICO ou TEXTO.
 """
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
+from string import Formatter
+
+
+# (ordinal do dia, "dd/mm/aaaa"): a data formatada so e refeita quando o dia muda
+_data_hoje_cache = [None, ""]
+
+
+def _data_hoje() -> str:
+    """Data atual no formato dd/mm/aaaa (padrao de data_atual nos prompts)."""
+    hoje = date.today()
+    ordinal = hoje.toordinal()
+    if _data_hoje_cache[0] != ordinal:
+        _data_hoje_cache[:] = [ordinal, hoje.strftime("%d/%m/%Y")]
+    return _data_hoje_cache[1]
+
+
+def _compilar_template(template: str):
+    """
+    Pre-processa um template de str.format uma unica vez (literais ja sem
+    escape + nomes dos campos). A funcao devolvida so concatena os valores,
+    sem reinterpretar o template inteiro a cada prompt.
+    Suporta apenas campos simples ({nome}), que e o que os templates usam.
+    """
+    partes = []
+    for literal, campo, spec, conversao in Formatter().parse(template):
+        if spec or conversao:
+            raise ValueError(f"Campo com formatacao nao suportado no template: {campo}")
+        partes.append((literal, campo))
+
+    def formatar(**valores) -> str:
+        return ''.join([
+            literal if campo is None else literal + str(valores[campo])
+            for literal, campo in partes
+        ])
+
+    return formatar
+
+
+def _canonizar(texto: str) -> str:
+    """
+    Forma canonica dos textos que entram nos prompts (quebras de linha \n,
+    sem espacos nas pontas). O cache de prompt dos provedores exige match
+    exato, entao o mesmo artigo precisa gerar sempre os mesmos bytes. Nao
+    normaliza Unicode: o LLM cita trechos do artigo e o track_changes os
+    procura byte a byte no DOCX, que pode estar em NFD.
+    """
+    if not texto:
+        return texto
+    return texto.replace('\r\n', '\n').strip()
+
 
 # =============================================================================
 # FORMATO DE SAIDA COMUM
@@ -20,6 +71,17 @@ ARTIGO_CONTEXT_TEMPLATE = """## ARTIGO PARA REVISAO
 ### Conteudo:
 
 {conteudo}"""
+_formatar_artigo_context = _compilar_template(ARTIGO_CONTEXT_TEMPLATE)
+
+
+@lru_cache(maxsize=8)
+def _montar_artigo_context(titulo: str, url: str, conteudo: str) -> str:
+    """Contexto do artigo canonizado; os agentes do mesmo artigo reaproveitam."""
+    return _formatar_artigo_context(
+        titulo=_canonizar(titulo),
+        url=_canonizar(url),
+        conteudo=_canonizar(conteudo)
+    )
 
 FORMATO_SAIDA = """
 ## FORMATO DE SAIDA OBRIGATORIO
@@ -49,6 +111,14 @@ Cada item do array deve ter esta estrutura:
 7. Se nao houver sugestoes, retorne array vazio: []
 """
 
+# FORMATO_SAIDA e constante: entra nos templates uma unica vez, na importacao,
+# com as chaves do JSON de exemplo escapadas para a formatacao posterior
+_FORMATO_SAIDA_TEMPLATE = FORMATO_SAIDA.replace('{', '{{').replace('}', '}}')
+
+# Nos templates de usuario, a parte fixa (tarefa + FORMATO_SAIDA) vem antes dos
+# campos variaveis: o cache de prefixo dos provedores so reaproveita o trecho
+# identico ate o primeiro byte que muda.
+
 # =============================================================================
 # AGENTE SEO
 # =============================================================================
@@ -97,25 +167,13 @@ Seu objetivo e melhorar a performance organica e conversao, garantindo que o art
 - Quando fornecidas, priorize a incorporacao das PALAVRAS-CHAVE PESQUISADAS nos pontos estrategicos (H1, H2, primeiros paragrafos)
 """
 
-SEO_USER_PROMPT_TEMPLATE = """## GUIA DE SEO DA EMPRESA
-
-{guia_seo}
-
----
-
-## PALAVRAS-CHAVE PRIORITARIAS (Google Search Console / Keyword Research)
-
-{palavras_chave}
-
----
-
-## TAREFA
+SEO_USER_PROMPT_TEMPLATE = """## TAREFA
 
-Analise o artigo fornecido no contexto seguindo o guia de SEO fornecido.
+Analise o artigo fornecido no contexto seguindo o guia de SEO fornecido abaixo.
 
 ### Prioridades:
 1. Identifique problemas de SEO e sugira correcoes especificas
-2. **IMPORTANTE**: Incorpore as palavras-chave prioritarias listadas acima de forma natural no texto
+2. **IMPORTANTE**: Incorpore as palavras-chave prioritarias listadas abaixo de forma natural no texto
    - Verifique se as palavras-chave ja estao presentes
    - Sugira onde e como incluir as que estao faltando
    - Priorize inclusao em: titulos, subtitulos, primeiro paragrafo, meta descricao implicita
@@ -123,7 +181,23 @@ Analise o artigo fornecido no contexto seguindo o guia de SEO fornecido.
 
 {formato_saida}
 
+---
+
+## GUIA DE SEO DA EMPRESA
+
+{guia_seo}
+
+---
+
+## PALAVRAS-CHAVE PRIORITARIAS (Google Search Console / Keyword Research)
+
+{palavras_chave}
+
+---
+
 Retorne o JSON com suas sugestoes de SEO:"""
+SEO_USER_PROMPT_TEMPLATE = SEO_USER_PROMPT_TEMPLATE.replace("{formato_saida}", _FORMATO_SAIDA_TEMPLATE)
+_formatar_seo_user = _compilar_template(SEO_USER_PROMPT_TEMPLATE)
 
 # =============================================================================
 # AGENTE TECNICO
@@ -171,13 +245,13 @@ NAO confie apenas no seu conhecimento pre-treinado para informacoes que mudam co
 - Seja especifico: indique exatamente o que esta desatualizado ou incorreto e forneca a correcao
 - Quando pesquisar na web, mencione a fonte (urls, referencias, bibliografias, citacoes etc.) na justificativa da revisao (ex: "Segundo a documentacao oficial do React...")
 """
+# O system prompt so varia com data_atual: reaproveitado entre os artigos do dia
+_formatar_tecnico_system = lru_cache(maxsize=8)(_compilar_template(TECNICO_SYSTEM_PROMPT))
 
-TECNICO_USER_PROMPT_TEMPLATE = """**Data de publicacao:** {data_publicacao}
-
-## TAREFA
+TECNICO_USER_PROMPT_TEMPLATE = """## TAREFA
 
 Analise o artigo fornecido no contexto do ponto de vista tecnico.
-Verifique se as informacoes estao corretas e atualizadas para {data_atual}.
+Verifique se as informacoes estao corretas e atualizadas para a data atual (informada abaixo).
 
 Considere:
 1. As versoes de bibliotecas/frameworks mencionadas estao atuais?
@@ -188,7 +262,14 @@ Considere:
 
 {formato_saida}
 
+---
+
+**Data de publicacao:** {data_publicacao}
+**Data atual:** {data_atual}
+
 Retorne o JSON com suas correcoes tecnicas:"""
+TECNICO_USER_PROMPT_TEMPLATE = TECNICO_USER_PROMPT_TEMPLATE.replace("{formato_saida}", _FORMATO_SAIDA_TEMPLATE)
+_formatar_tecnico_user = _compilar_template(TECNICO_USER_PROMPT_TEMPLATE)
 
 # =============================================================================
 # AGENTE TEXTO
@@ -277,6 +358,9 @@ Considere:
 {formato_saida}
 
 Retorne o JSON com suas sugestoes textuais:"""
+TEXTO_USER_PROMPT_TEMPLATE = TEXTO_USER_PROMPT_TEMPLATE.replace("{formato_saida}", _FORMATO_SAIDA_TEMPLATE)
+# Sem campos variaveis: o prompt final e fixo
+_TEXTO_USER_PROMPT = TEXTO_USER_PROMPT_TEMPLATE.format()
 
 
 def formatar_prompt_seo(
@@ -287,15 +371,10 @@ def formatar_prompt_seo(
     palavras_chave: str = "Nenhuma palavra-chave especifica fornecida. Use seu conhecimento de SEO."
 ) -> tuple:
     """Retorna (system_prompt, user_prompt, artigo_context) para revisao SEO."""
-    artigo_context = ARTIGO_CONTEXT_TEMPLATE.format(
-        titulo=titulo,
-        url=url,
-        conteudo=conteudo
-    )
-    user_prompt = SEO_USER_PROMPT_TEMPLATE.format(
-        guia_seo=guia_seo,
-        palavras_chave=palavras_chave,
-        formato_saida=FORMATO_SAIDA
+    artigo_context = _montar_artigo_context(titulo, url, conteudo)
+    user_prompt = _formatar_seo_user(
+        guia_seo=_canonizar(guia_seo),
+        palavras_chave=_canonizar(palavras_chave)
     )
     return SEO_SYSTEM_PROMPT, user_prompt, artigo_context
 
@@ -309,18 +388,13 @@ def formatar_prompt_tecnico(
 ) -> tuple:
     """Retorna (system_prompt, user_prompt, artigo_context) para revisao tecnica."""
     if not data_atual:
-        data_atual = datetime.now().strftime("%d/%m/%Y")
+        data_atual = _data_hoje()
 
-    artigo_context = ARTIGO_CONTEXT_TEMPLATE.format(
-        titulo=titulo,
-        url=url,
-        conteudo=conteudo
-    )
-    system_prompt = TECNICO_SYSTEM_PROMPT.format(data_atual=data_atual)
-    user_prompt = TECNICO_USER_PROMPT_TEMPLATE.format(
+    artigo_context = _montar_artigo_context(titulo, url, conteudo)
+    system_prompt = _formatar_tecnico_system(data_atual=data_atual)
+    user_prompt = _formatar_tecnico_user(
         data_publicacao=data_publicacao or "Nao informada",
-        data_atual=data_atual,
-        formato_saida=FORMATO_SAIDA
+        data_atual=data_atual
     )
     return system_prompt, user_prompt, artigo_context
 
@@ -331,14 +405,8 @@ def formatar_prompt_texto(
     url: str = ""
 ) -> tuple:
     """Retorna (system_prompt, user_prompt, artigo_context) para revisao textual."""
-    artigo_context = ARTIGO_CONTEXT_TEMPLATE.format(
-        titulo=titulo,
-        url=url,
-        conteudo=conteudo
-    )
-    user_prompt = TEXTO_USER_PROMPT_TEMPLATE.format(
-        formato_saida=FORMATO_SAIDA
-    )
+    artigo_context = _montar_artigo_context(titulo, url, conteudo)
+    user_prompt = _TEXTO_USER_PROMPT
     return TEXTO_SYSTEM_PROMPT, user_prompt, artigo_context
 
 
@@ -476,6 +544,8 @@ ERRADO (seria descartado):
 - Foque APENAS em aspectos visuais e de acessibilidade
 - Quando pesquisar na web para verificar interfaces, mencione a fonte na justificativa
 """
+# O system prompt so varia com data_atual: reaproveitado entre os artigos do dia
+_formatar_imagem_system = lru_cache(maxsize=8)(_compilar_template(IMAGEM_SYSTEM_PROMPT))
 
 IMAGEM_USER_PROMPT_TEMPLATE = """### Imagens do artigo:
 
@@ -496,6 +566,35 @@ Considere:
 5. Faltam imagens em secoes que se beneficiariam de elementos visuais?
 
 Retorne o JSON com suas sugestoes de imagem:"""
+_formatar_imagem_user = _compilar_template(IMAGEM_USER_PROMPT_TEMPLATE)
+
+
+def _formatar_bloco_imagem(i: int, img: dict) -> str:
+    """Bloco de uma imagem na lista do prompt de imagens (montado em uma so string)."""
+    img_alt = (img.get('alt') or '').strip()
+
+    # Ancora: trecho que existe literalmente no DOCX (ver REGRA CRITICA)
+    ancora = (img.get('ancora') or '').strip()
+    if ancora:
+        origem = (
+            "legenda da imagem no documento"
+            if img.get('ancora_tipo') == 'legenda'
+            else "texto proximo a imagem (a imagem nao tem legenda no documento)"
+        )
+        linha_ancora = f'- ANCORA ({origem}) -> copie em texto_original: "{ancora}"'
+    else:
+        linha_ancora = (
+            "- ANCORA: nao disponivel. Use um trecho literal do artigo "
+            "proximo a esta imagem."
+        )
+
+    return (
+        f"**Imagem {i}:**\n"
+        f"- URL: {img.get('url', 'URL nao disponivel')}\n"
+        f"- Alt text: {img_alt if img_alt else 'SEM ALT TEXT'}\n"
+        f"- Dimensoes: {img.get('width', 'N/A')}x{img.get('height', 'N/A')}\n"
+        f"{linha_ancora}"
+    )
 
 
 def formatar_prompt_imagem(
@@ -516,50 +615,17 @@ def formatar_prompt_imagem(
         data_atual: Data atual para verificacao de atualizacao
     """
     if not data_atual:
-        data_atual = datetime.now().strftime("%d/%m/%Y")
+        data_atual = _data_hoje()
 
-    artigo_context = ARTIGO_CONTEXT_TEMPLATE.format(
-        titulo=titulo,
-        url=url,
-        conteudo=conteudo
-    )
+    artigo_context = _montar_artigo_context(titulo, url, conteudo)
 
     # Formata lista de imagens para o prompt
-    imagens_texto = []
-    for i, img in enumerate(imagens, 1):
-        img_url = img.get('url', 'URL nao disponivel')
-        img_alt = (img.get('alt') or '').strip()
-        img_width = img.get('width', 'N/A')
-        img_height = img.get('height', 'N/A')
-
-        linhas = [
-            f"**Imagem {i}:**",
-            f"- URL: {img_url}",
-            f"- Alt text: {img_alt if img_alt else 'SEM ALT TEXT'}",
-            f"- Dimensoes: {img_width}x{img_height}",
-        ]
-
-        # Ancora: trecho que existe literalmente no DOCX (ver REGRA CRITICA)
-        ancora = (img.get('ancora') or '').strip()
-        if ancora:
-            origem = (
-                "legenda da imagem no documento"
-                if img.get('ancora_tipo') == 'legenda'
-                else "texto proximo a imagem (a imagem nao tem legenda no documento)"
-            )
-            linhas.append(f'- ANCORA ({origem}) -> copie em texto_original: "{ancora}"')
-        else:
-            linhas.append(
-                "- ANCORA: nao disponivel. Use um trecho literal do artigo "
-                "proximo a esta imagem."
-            )
-
-        imagens_texto.append("\n".join(linhas))
-
-    imagens_formatadas = "\n\n".join(imagens_texto) if imagens_texto else "Nenhuma imagem encontrada no artigo."
-
-    system_prompt = IMAGEM_SYSTEM_PROMPT.format(data_atual=data_atual)
-    user_prompt = IMAGEM_USER_PROMPT_TEMPLATE.format(
+    imagens_formatadas = "\n\n".join(
+        _formatar_bloco_imagem(i, img) for i, img in enumerate(imagens, 1)
+    ) or "Nenhuma imagem encontrada no artigo."
+
+    system_prompt = _formatar_imagem_system(data_atual=data_atual)
+    user_prompt = _formatar_imagem_user(
         imagens=imagens_formatadas,
         data_atual=data_atual
     )
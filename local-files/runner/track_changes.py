@@ -10,13 +10,20 @@ Suporta:
 - Preservacao de formatacao (w:rPr) em insercoes e reconstrucoes
 - Preservacao de hyperlinks em trechos nao afetados
 """
+import copy
+import hashlib
+import json
 import os
+import posixpath
 import re
-import shutil
-import tempfile
+import threading
+import time
 import zipfile
-from copy import deepcopy
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 from lxml import etree
@@ -33,15 +40,145 @@ XML_NS = '{http://www.w3.org/XML/1998/namespace}'
 R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
 REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
 
+# Tags e atributos (notacao Clark) usados nos loops e na criacao de
+# elementos: montados uma vez aqui em vez de um f-string por uso. O lxml
+# devolve um str novo a cada .tag, entao a comparacao continua sendo por ==
+# (nao por `is`)
+W_P = f'{W_NS}p'
+W_R = f'{W_NS}r'
+W_T = f'{W_NS}t'
+W_RPR = f'{W_NS}rPr'
+W_HYPERLINK = f'{W_NS}hyperlink'
+W_INS = f'{W_NS}ins'
+W_DEL = f'{W_NS}del'
+W_DELTEXT = f'{W_NS}delText'
+W_ID = f'{W_NS}id'
+W_AUTHOR = f'{W_NS}author'
+W_DATE = f'{W_NS}date'
+W_COMMENTS = f'{W_NS}comments'
+W_COMMENT = f'{W_NS}comment'
+W_COMMENT_RANGE_START = f'{W_NS}commentRangeStart'
+W_COMMENT_RANGE_END = f'{W_NS}commentRangeEnd'
+W_COMMENT_REFERENCE = f'{W_NS}commentReference'
+W_TRACK_REVISIONS = f'{W_NS}trackRevisions'
+XML_SPACE = f'{XML_NS}space'
+REL_RELATIONSHIPS = f'{{{REL_NS}}}Relationships'
+REL_RELATIONSHIP = f'{{{REL_NS}}}Relationship'
+
+# Namespaces da raiz do comments.xml
+COMMENTS_NSMAP = {'w': NAMESPACES['w']}
+
+# Registro da parte word/comments.xml no pacote
+COMMENTS_PART_NAME = '/word/comments.xml'
+COMMENTS_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml'
+COMMENTS_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments'
+REL_ID_RE = re.compile(r'rId(\d+)$')
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+
 # Caracteres de bullet/lista que LLMs incluem do texto renderizado
 # mas que nao existem no XML do DOCX (sao formatacao de paragrafo)
-BULLET_CHARS = set('\u2022\u00b7\u25aa\u25b8\u25ba\u25c6\u25c7\u25cb\u25cf\u25a0\u25a1')
+BULLET_CHARS = frozenset('\u2022\u00b7\u25aa\u25b8\u25ba\u25c6\u25c7\u25cb\u25cf\u25a0\u25a1')
+
+# Bullets + todos os espacos de str.isspace (o maior e U+3000): strip_bullets
+# remove a sequencia inicial de ambos com um unico lstrip em C
+BULLETS_E_ESPACOS = ''.join(sorted(BULLET_CHARS)) + ''.join(
+    ch for ch in map(chr, range(0x3001)) if ch.isspace()
+)
 
 # Marcadores de paragrafo que o runner injeta no texto enviado ao LLM
 # (ex: "[P15|HEADING2] "), e que os agentes as vezes copiam de volta no
 # texto_original. Eles nao existem no DOCX, entao a busca falharia sempre.
 MARCADOR_PARAGRAFO_RE = re.compile(r'\[P\d+(?:\|[A-Z0-9_]+)?\]\s*')
 
+# Substituicoes de caractere da normalizacao: smart quotes -> retas,
+# dashes -> '-', NBSP -> espaco e zero-width removidos ('')
+NORMALIZACAO_CHARS = {
+    '\u201c': '"', '\u201d': '"',
+    '\u2018': "'", '\u2019': "'",
+    '\u2013': '-', '\u2014': '-',
+    '\u00a0': ' ',
+    '\u200b': '', '\u200c': '', '\u200d': '', '\ufeff': '',
+}
+# Mesma tabela para normalizar_texto, aplicada num unico str.translate
+NORMALIZACAO_TRANS = str.maketrans({
+    ch: (novo or None) for ch, novo in NORMALIZACAO_CHARS.items()
+})
+ESPACOS_RE = re.compile(r'\s+')
+# Separador de normalizar_textos: NUL nao casa com \s e nao e valido em XML
+SEPARADOR_LOTE = '\x00'
+
+# Whitespace que normalizar_com_mapa colapsa, e as sequencias dele que o
+# caminho rapido precisa tratar (2+ espacos, ou tab/quebra de linha)
+ESPACOS_MAPA = ' \t\n\r'
+ESPACOS_LONGOS_RE = re.compile(r'[ \t\n\r]{2,}')
+ESPACOS_MAPA_RE = re.compile(r'[ \t\n\r]+')
+
+# Caracteres que a normalizacao remove: sem eles, o translate preserva as
+# posicoes e normalizar_com_mapa nao precisa do loop por caractere
+ZERO_WIDTH_CHARS = tuple(ch for ch, novo in NORMALIZACAO_CHARS.items() if not novo)
+
+# Mapa identidade (0, 1, 2, ...) reaproveitado pelo caminho rapido: fatias
+# de array sao copiadas em C, sem criar um int Python por posicao
+_mapa_identidade = array('i')
+
+# Parser XML por thread (um XMLParser do lxml nao pode ser usado por duas
+# threads ao mesmo tempo): sem colecao de IDs, que o OOXML nao usa, e sem o
+# limite de tamanho de no da libxml2, que documentos grandes podem estourar
+_parser_local = threading.local()
+
+
+def _parte_do_target(target: str) -> str:
+    """
+    Resolve o Target de um relacionamento de word/document.xml para o nome
+    da parte no pacote ("comments.xml", "./comments.xml" e
+    "/word/comments.xml" viram "/word/comments.xml").
+    """
+    if target.startswith('/'):
+        return posixpath.normpath(target)
+    return posixpath.normpath(posixpath.join('/word', target))
+
+
+def _parser_xml():
+    """Retorna o XMLParser da thread atual, criando-o na primeira chamada."""
+    parser = getattr(_parser_local, 'parser', None)
+    if parser is None:
+        parser = _parser_local.parser = etree.XMLParser(collect_ids=False, huge_tree=True)
+    return parser
+
+
+# Cache de resultados: reaplicar as mesmas revisoes ao mesmo DOCX (reexecucao
+# de um workflow) devolve o DOCX ja gerado sem reprocessar o XML. As datas
+# das revisoes (w:date) ficam as da primeira execucao
+RESULT_CACHE_TTL = int(os.getenv("DOCX_RESULT_CACHE_TTL", "0"))  # segundos (0 = desligado)
+RESULT_CACHE_MAX_BYTES = 128 * 1024 * 1024  # 128 MB
+
+# Cache LRU chave -> (expira_em, docx_bytes, resultado), limitado por bytes
+_result_cache = OrderedDict()
+_result_cache_bytes = 0
+_result_cache_lock = threading.Lock()
+
+# Compressao do DOCX de saida: deflate nivel 1 (o "SuperFast" que o proprio
+# Word usa) e midia que ja e comprimida gravada sem recompressao
+NIVEL_COMPRESSAO_ZIP = 1
+EXTENSOES_JA_COMPRIMIDAS = (
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.mp3', '.m4a', '.zip',
+)
+
+# XPaths compilados uma unica vez: textos dos runs filhos (hyperlink/ins) e
+# rPr dos runs filhos, sem loop Python por w:t. O texto de um run isolado
+# sai de um loop direto pelos filhos, mais barato que chamar um XPath.
+TEXTOS_RUNS_XPATH = etree.XPath('w:r/w:t/text()', namespaces=NAMESPACES, smart_strings=False)
+RPR_RUNS_XPATH = etree.XPath('w:r/w:rPr', namespaces=NAMESPACES)
+
+
+def _clonar(elemento):
+    """
+    Copia profunda de um elemento lxml (subarvore inteira). Em lxml, __copy__
+    ja e profundo e roda o mesmo codigo C do deepcopy, mas sem passar pelo
+    protocolo do modulo copy.
+    """
+    return elemento.__copy__()
+
 
 # =============================================================================
 # FUNCOES DE NORMALIZACAO
@@ -74,53 +211,79 @@ def sanitizar_revisoes(revisoes: list) -> list:
     return limpas
 
 
+@lru_cache(maxsize=4096)
 def normalizar_texto(texto: str) -> str:
-    """Normaliza texto para matching flexivel."""
-    # Smart quotes -> retas
-    texto = texto.replace('\u201c', '"').replace('\u201d', '"')
-    texto = texto.replace('\u2018', "'").replace('\u2019', "'")
-    # Dashes
-    texto = texto.replace('\u2013', '-').replace('\u2014', '-')
-    # Espacos especiais
-    texto = texto.replace('\u00a0', ' ')
-    # Zero-width chars
-    texto = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', texto)
+    """
+    Normaliza texto para matching flexivel.
+    Memoizado: a busca de comentarios renormaliza o texto de cada paragrafo
+    a cada comentario, e os agentes repetem os mesmos trechos.
+    """
+    # ASCII puro (o caso comum) nao tem aspas curvas, dashes, NBSP nem
+    # zero-width: so resta colapsar whitespace
+    if texto.isascii():
+        return ESPACOS_RE.sub(' ', texto).strip()
+    # Smart quotes, dashes, espacos especiais e zero-width chars
+    texto = texto.translate(NORMALIZACAO_TRANS)
     # Colapsar whitespace
-    texto = re.sub(r'\s+', ' ', texto).strip()
+    texto = ESPACOS_RE.sub(' ', texto).strip()
     return texto
 
 
+def normalizar_textos(textos: list) -> list:
+    """
+    normalizar_texto para uma lista inteira: junta tudo com um separador que
+    nao e whitespace (e nao aparece em texto XML) e faz um unico translate +
+    um unico colapso de whitespace, em vez de uma chamada por texto.
+    """
+    if not textos:
+        return []
+    juntos = SEPARADOR_LOTE.join(textos)
+    if juntos.count(SEPARADOR_LOTE) != len(textos) - 1:
+        # Algum texto contem o separador: normaliza um a um
+        return [normalizar_texto(texto) for texto in textos]
+    if not juntos.isascii():
+        juntos = juntos.translate(NORMALIZACAO_TRANS)
+    return [parte.strip() for parte in ESPACOS_RE.sub(' ', juntos).split(SEPARADOR_LOTE)]
+
+
 def strip_bullets(texto: str) -> str:
     """Remove caracteres de bullet do inicio do texto."""
-    texto = texto.lstrip()
-    while texto and texto[0] in BULLET_CHARS:
-        texto = texto[1:].lstrip()
-    return texto
+    return texto.lstrip(BULLETS_E_ESPACOS)
 
 
 def normalizar_com_mapa(texto: str):
     """
     Normaliza texto e constroi mapeamento de posicoes normalizadas -> originais.
     Retorna (texto_normalizado, mapa) onde mapa[norm_pos] = orig_pos.
+    O mapa e um array('i') (ints nativos, nao objetos int), ja que fica
+    guardado no indice de paragrafos durante toda a aplicacao.
     """
+    if texto.isascii():
+        return _colapsar_espacos_com_mapa(texto)
+    # Sem zero-width, as substituicoes sao 1 para 1: um translate em C
+    # mantem as posicoes e so resta colapsar whitespace
+    if not any(ch in texto for ch in ZERO_WIDTH_CHARS):
+        return _colapsar_espacos_com_mapa(texto.translate(NORMALIZACAO_TRANS))
+
     resultado = []
-    mapa = []
+    mapa = array('i')
     prev_space = True
 
+    substituir = NORMALIZACAO_CHARS.get
+
     for orig_idx, ch in enumerate(texto):
-        out_ch = ch
-        if ch in '\u201c\u201d':
-            out_ch = '"'
-        elif ch in '\u2018\u2019':
-            out_ch = "'"
-        elif ch in '\u2013\u2014':
-            out_ch = '-'
-        elif ch == '\u00a0':
-            out_ch = ' '
-        elif ch in '\u200b\u200c\u200d\ufeff':
-            continue
+        # Um lookup por caractere; '' marca os zero-width a descartar
+        out_ch = substituir(ch, ch)
 
-        if out_ch in ' \t\n\r':
+        # Todo whitespace colapsado e <= ' ': o caso comum (caractere
+        # visivel) sai com uma unica comparacao
+        if out_ch > ' ':
+            resultado.append(out_ch)
+            mapa.append(orig_idx)
+            prev_space = False
+        elif not out_ch:
+            continue
+        elif out_ch in ESPACOS_MAPA:
             if not prev_space:
                 resultado.append(' ')
                 mapa.append(orig_idx)
@@ -130,18 +293,57 @@ def normalizar_com_mapa(texto: str):
             mapa.append(orig_idx)
             prev_space = False
 
-    # Strip leading
-    while resultado and resultado[0] == ' ':
-        resultado.pop(0)
-        mapa.pop(0)
-    # Strip trailing
-    while resultado and resultado[-1] == ' ':
+    # Espaco inicial nunca e emitido (prev_space comeca True) e o colapso
+    # deixa no maximo um espaco no final: basta um pop, sem pop(0) em O(n)
+    if resultado and resultado[-1] == ' ':
         resultado.pop()
         mapa.pop()
 
     return ''.join(resultado), mapa
 
 
+def _identidade(tamanho: int) -> array:
+    """Retorna um mapa identidade com pelo menos `tamanho` posicoes."""
+    global _mapa_identidade
+    identidade = _mapa_identidade
+    if len(identidade) < tamanho:
+        # Substitui (nao estende) o array: threads que ja o leram seguem
+        # com a versao anterior, que continua valida
+        identidade = array('i', range(max(tamanho, 2 * len(identidade))))
+        _mapa_identidade = identidade
+    return identidade
+
+
+def _colapsar_espacos_com_mapa(texto: str):
+    """
+    normalizar_com_mapa para texto sem caracteres a substituir ou remover
+    (ASCII, ou ja passado pelo translate): so whitespace a colapsar. O mapa
+    e o identidade menos as posicoes descartadas, montado com fatias; sem
+    tab/quebra de linha nem espacos repetidos (o caso comum) o texto ja esta
+    normalizado.
+    """
+    inicio = len(texto) - len(texto.lstrip(ESPACOS_MAPA))
+    fim = len(texto.rstrip(ESPACOS_MAPA))
+    if inicio >= fim:
+        return '', array('i')
+
+    identidade = _identidade(fim)
+    trecho = texto[inicio:fim]
+    if ('  ' not in trecho and '\t' not in trecho
+            and '\n' not in trecho and '\r' not in trecho):
+        return trecho, identidade[inicio:fim]
+
+    # Cada sequencia longa mantem so a primeira posicao (vira um espaco)
+    mapa = array('i')
+    pos = inicio
+    for m in ESPACOS_LONGOS_RE.finditer(texto, inicio, fim):
+        mapa += identidade[pos:m.start() + 1]
+        pos = m.end()
+    mapa += identidade[pos:fim]
+
+    return ESPACOS_MAPA_RE.sub(' ', trecho), mapa
+
+
 # =============================================================================
 # CLASSE PRINCIPAL
 # =============================================================================
@@ -155,9 +357,16 @@ class TrackChangesApplicator:
 
         if not self.input_path.exists():
             raise FileNotFoundError(f"Arquivo nao encontrado: {input_path}")
+        # A saida e gravada enquanto o ZIP de entrada ainda esta sendo lido
+        if self.output_path.resolve() == self.input_path.resolve():
+            raise ValueError(f"Arquivo de saida deve ser diferente do de entrada: {output_path}")
 
-        self.temp_dir = None
+        self.zip_entrada = None
+        self.partes = {}
         self.doc_root = None
+        self.indice_paragrafos = None
+        self.posicoes_indice = {}
+        self.indice_comentarios = None
         self.revision_id = 1
         self.comments = []
         self.resultados = []
@@ -178,6 +387,8 @@ class TrackChangesApplicator:
             dict com estatisticas e detalhes
         """
         self.autor = autor
+        # Mesmo carimbo para todas as revisoes/comentarios desta aplicacao
+        self.data_revisao = datetime.now().isoformat()
         self.revision_id = 1
         self.comments = []
         self.resultados = []
@@ -185,19 +396,17 @@ class TrackChangesApplicator:
         # Remove marcadores [Pxx|TIPO] que o LLM tenha copiado do prompt
         revisoes = sanitizar_revisoes(revisoes)
 
-        # Copia arquivo para output
-        shutil.copy(self.input_path, self.output_path)
-
-        # Extrai DOCX para diretorio temporario
-        self.temp_dir = tempfile.mkdtemp()
-        with zipfile.ZipFile(self.output_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_dir)
+        # Le as partes direto do DOCX de entrada (sem copia nem extracao em
+        # disco); as partes alteradas ficam em self.partes ate a gravacao
+        self.partes = {}
+        self.zip_entrada = zipfile.ZipFile(self.input_path, 'r')
 
         try:
             # Carrega document.xml
-            doc_xml_path = os.path.join(self.temp_dir, 'word', 'document.xml')
-            tree = etree.parse(doc_xml_path)
+            tree = self._parse_parte('word/document.xml')
             self.doc_root = tree.getroot()
+            self.indice_paragrafos = None
+            self.indice_comentarios = None
 
             # Habilita Track Changes
             self._habilitar_track_changes()
@@ -222,14 +431,14 @@ class TrackChangesApplicator:
                 self._adicionar_comments()
 
             # Salva document.xml
-            tree.write(doc_xml_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+            self._gravar_parte('word/document.xml', tree)
 
             # Recompacta DOCX
             self._recompactar_docx()
 
         finally:
-            if self.temp_dir:
-                shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.zip_entrada.close()
+            self.partes = {}
 
         total_ok = sum(1 for r in self.resultados if r.get("ok"))
         total_falhas = sum(1 for r in self.resultados if not r.get("ok"))
@@ -255,6 +464,8 @@ class TrackChangesApplicator:
         """
         vistos = {}
         processadas = []
+        # Chaves de todas as revisoes de uma vez (vazias viram '' e sao puladas)
+        chaves = normalizar_textos([rev.get('texto_original') or '' for rev in revisoes])
 
         for idx, rev in enumerate(revisoes):
             texto_orig = rev.get('texto_original', '')
@@ -262,7 +473,7 @@ class TrackChangesApplicator:
                 processadas.append(rev)
                 continue
 
-            chave = normalizar_texto(texto_orig)
+            chave = chaves[idx]
 
             if chave in vistos:
                 rev_copia = dict(rev)
@@ -288,39 +499,35 @@ class TrackChangesApplicator:
     # BUSCA DE TEXTO (nivel de paragrafo, multi-run, com hyperlinks)
     # =========================================================================
 
-    def _obter_segmentos_paragrafo(self, paragraph):
+    def _obter_segmentos_paragrafo(self, paragraph, incluir_ins: bool = False):
         """
         Obtem todos os segmentos de texto de um paragrafo com suas posicoes.
-        Inclui texto de w:r diretos E de w:hyperlink.
+        Inclui texto de w:r diretos E de w:hyperlink (e de w:ins, com
+        incluir_ins, para marcar comentarios sobre texto ja inserido).
         Cada segmento e um dict com: element, text, start, end, rPr, type.
         """
         segments = []
         current_pos = 0
 
         for child in paragraph:
-            if child.tag == f'{W_NS}r':
-                run_text = ''
-                for t in child.findall(f'{W_NS}t'):
-                    run_text += (t.text or '')
+            if child.tag == W_R:
+                run_text = ''.join([t.text or '' for t in child if t.tag == W_T])
                 if run_text:
                     segments.append({
                         'element': child,
                         'text': run_text,
                         'start': current_pos,
                         'end': current_pos + len(run_text),
-                        'rPr': child.find(f'{W_NS}rPr'),
+                        'rPr': child.find(W_RPR),
                         'type': 'run',
                     })
                     current_pos += len(run_text)
 
-            elif child.tag == f'{W_NS}hyperlink':
-                hl_text = ''
-                hl_rPr = None
-                for r in child.findall(f'{W_NS}r'):
-                    for t in r.findall(f'{W_NS}t'):
-                        hl_text += (t.text or '')
-                    if hl_rPr is None:
-                        hl_rPr = r.find(f'{W_NS}rPr')
+            elif child.tag == W_HYPERLINK:
+                hl_text = ''.join(TEXTOS_RUNS_XPATH(child))
+                # rPr do primeiro run que tiver formatacao
+                hl_rPrs = RPR_RUNS_XPATH(child)
+                hl_rPr = hl_rPrs[0] if hl_rPrs else None
                 if hl_text:
                     segments.append({
                         'element': child,
@@ -332,8 +539,67 @@ class TrackChangesApplicator:
                     })
                     current_pos += len(hl_text)
 
+            elif incluir_ins and child.tag == W_INS:
+                ins_text = ''.join(TEXTOS_RUNS_XPATH(child))
+                if ins_text:
+                    segments.append({
+                        'element': child,
+                        'text': ins_text,
+                        'start': current_pos,
+                        'end': current_pos + len(ins_text),
+                        'rPr': None,
+                        'type': 'ins',
+                    })
+                    current_pos += len(ins_text)
+
         return segments
 
+    def _indexar_paragrafos(self):
+        """
+        Monta (uma unica vez por documento) o indice de texto dos paragrafos.
+        Cada entrada e [paragraph, segments, full_text, full_norm, full_mapa,
+        fins], onde fins sao os offsets finais dos segmentos (para busca
+        binaria); a versao normalizada so e calculada quando alguma busca
+        precisar dela.
+        """
+        if self.indice_paragrafos is not None:
+            return self.indice_paragrafos
+
+        indice = []
+        posicoes = {}
+        for paragraph in self.doc_root.iter(W_P):
+            entrada = self._montar_entrada_indice(paragraph)
+            if entrada is not None:
+                posicoes[paragraph] = len(indice)
+                indice.append(entrada)
+        self.indice_paragrafos = indice
+        self.posicoes_indice = posicoes
+        return indice
+
+    def _montar_entrada_indice(self, paragraph):
+        """Extrai segmentos e texto de um paragrafo (None se nao tiver texto)."""
+        segments = self._obter_segmentos_paragrafo(paragraph)
+        if not segments:
+            return None
+
+        full_text = ''.join(s['text'] for s in segments)
+        if not full_text.strip():
+            return None
+
+        return [paragraph, segments, full_text, None, None,
+                [s['end'] for s in segments]]
+
+    def _reindexar_paragrafo(self, paragraph):
+        """
+        Atualiza a entrada do indice de um paragrafo apos uma alteracao.
+        Paragrafo que ficou sem texto vira None (as posicoes nao mudam).
+        """
+        if self.indice_paragrafos is None:
+            return
+        pos = self.posicoes_indice.get(paragraph)
+        if pos is not None:
+            self.indice_paragrafos[pos] = self._montar_entrada_indice(paragraph)
+
     def _encontrar_texto(self, texto_busca: str):
         """
         Encontra texto_busca no documento, buscando no nivel de paragrafo.
@@ -344,29 +610,41 @@ class TrackChangesApplicator:
         2. Match normalizado (smart quotes, whitespace, etc)
         3. Match com bullets removidos
         4. Match normalizado + sem bullets
-        """
-        texto_norm = normalizar_texto(texto_busca)
-        texto_sem_bullet = strip_bullets(texto_busca)
-        texto_sem_bullet_norm = normalizar_texto(texto_sem_bullet)
 
-        for paragraph in self.doc_root.iter(f'{W_NS}p'):
-            segments = self._obter_segmentos_paragrafo(paragraph)
-            if not segments:
-                continue
+        O match exato e procurado antes no documento inteiro (so str.find);
+        o texto da revisao e os paragrafos so sao normalizados se nenhum
+        paragrafo tiver o texto exato.
 
-            full_text = ''.join(s['text'] for s in segments)
-            if not full_text.strip():
-                continue
+        Usa o indice de paragrafos em vez de percorrer o XML a cada revisao;
+        as operacoes que alteram um paragrafo chamam _reindexar_paragrafo.
+        """
+        indice = self._indexar_paragrafos()
 
-            # Estrategia 1: match exato
-            idx = full_text.find(texto_busca)
+        # Estrategia 1: match exato
+        for entrada in indice:
+            if entrada is None:
+                continue
+            idx = entrada[2].find(texto_busca)
             if idx >= 0:
                 return self._montar_resultado_match(
-                    paragraph, segments, full_text, idx, idx + len(texto_busca)
+                    entrada[0], entrada[1], entrada[2], idx, idx + len(texto_busca), entrada[5]
                 )
 
+        texto_norm = normalizar_texto(texto_busca)
+        texto_sem_bullet = strip_bullets(texto_busca)
+        texto_sem_bullet_norm = normalizar_texto(texto_sem_bullet)
+
+        for entrada in indice:
+            if entrada is None:
+                continue
+            paragraph, segments, full_text, fins = (
+                entrada[0], entrada[1], entrada[2], entrada[5]
+            )
+
             # Estrategia 2: match normalizado
-            full_norm, full_mapa = normalizar_com_mapa(full_text)
+            if entrada[3] is None:
+                entrada[3], entrada[4] = normalizar_com_mapa(full_text)
+            full_norm, full_mapa = entrada[3], entrada[4]
             idx_norm = full_norm.find(texto_norm)
             if idx_norm >= 0:
                 orig_start, orig_end = self._mapear_posicao(
@@ -374,7 +652,7 @@ class TrackChangesApplicator:
                 )
                 if orig_start is not None:
                     return self._montar_resultado_match(
-                        paragraph, segments, full_text, orig_start, orig_end
+                        paragraph, segments, full_text, orig_start, orig_end, fins
                     )
 
             # Estrategia 3: sem bullets (match exato)
@@ -382,7 +660,7 @@ class TrackChangesApplicator:
                 idx = full_text.find(texto_sem_bullet)
                 if idx >= 0:
                     return self._montar_resultado_match(
-                        paragraph, segments, full_text, idx, idx + len(texto_sem_bullet)
+                        paragraph, segments, full_text, idx, idx + len(texto_sem_bullet), fins
                     )
 
             # Estrategia 4: sem bullets + normalizado
@@ -394,7 +672,7 @@ class TrackChangesApplicator:
                     )
                     if orig_start is not None:
                         return self._montar_resultado_match(
-                            paragraph, segments, full_text, orig_start, orig_end
+                            paragraph, segments, full_text, orig_start, orig_end, fins
                         )
 
         return None
@@ -412,12 +690,19 @@ class TrackChangesApplicator:
 
         return orig_start, orig_end
 
-    def _montar_resultado_match(self, paragraph, segments, full_text, match_start, match_end):
-        """Monta o dict de resultado com segmentos afetados."""
+    def _montar_resultado_match(self, paragraph, segments, full_text, match_start,
+                                match_end, fins=None):
+        """
+        Monta o dict de resultado com segmentos afetados.
+        Com a tabela de offsets finais (fins), o primeiro segmento afetado e
+        localizado por busca binaria em vez de varrer o paragrafo inteiro.
+        """
+        if fins is None:
+            fins = [s['end'] for s in segments]
         affected = []
-        for s in segments:
-            if s['end'] <= match_start or s['start'] >= match_end:
-                continue
+        for s in segments[bisect_right(fins, match_start):]:
+            if s['start'] >= match_end:
+                break
 
             clip_start = max(match_start - s['start'], 0)
             clip_end = min(match_end - s['start'], len(s['text']))
@@ -454,59 +739,38 @@ class TrackChangesApplicator:
     def _encontrar_texto_para_comentario(self, texto_busca: str):
         """
         Busca texto incluindo dentro de w:ins e w:hyperlink.
-        Usado para marcar comentarios.
+        Usado para marcar comentarios. Os comentarios sao marcados depois de
+        todas as revisoes e nao alteram texto, entao o indice (com w:ins) e
+        montado uma unica vez para todos eles.
         """
         texto_norm = normalizar_texto(texto_busca)
 
-        for paragraph in self.doc_root.iter(f'{W_NS}p'):
-            elements_info = []
-            current_pos = 0
-
-            for child in paragraph:
-                if child.tag == f'{W_NS}r':
-                    run_text = ''.join(t.text or '' for t in child.findall(f'{W_NS}t'))
-                    if run_text:
-                        elements_info.append({
-                            'element': child, 'text': run_text,
-                            'start': current_pos, 'end': current_pos + len(run_text),
-                        })
-                        current_pos += len(run_text)
-                elif child.tag == f'{W_NS}ins':
-                    for r in child.findall(f'{W_NS}r'):
-                        run_text = ''.join(t.text or '' for t in r.findall(f'{W_NS}t'))
-                        if run_text:
-                            elements_info.append({
-                                'element': child, 'text': run_text,
-                                'start': current_pos, 'end': current_pos + len(run_text),
-                            })
-                            current_pos += len(run_text)
-                elif child.tag == f'{W_NS}hyperlink':
-                    for r in child.findall(f'{W_NS}r'):
-                        run_text = ''.join(t.text or '' for t in r.findall(f'{W_NS}t'))
-                        if run_text:
-                            elements_info.append({
-                                'element': child, 'text': run_text,
-                                'start': current_pos, 'end': current_pos + len(run_text),
-                            })
-                            current_pos += len(run_text)
-
-            if not elements_info:
-                continue
+        if self.indice_comentarios is None:
+            # Entradas [paragraph, segments, full_text, full_norm]; full_norm
+            # so e calculado na primeira busca normalizada do paragrafo
+            self.indice_comentarios = []
+            for paragraph in self.doc_root.iter(W_P):
+                segments = self._obter_segmentos_paragrafo(paragraph, incluir_ins=True)
+                if segments:
+                    full_text = ''.join(s['text'] for s in segments)
+                    self.indice_comentarios.append([paragraph, segments, full_text, None])
 
-            full_text = ''.join(ei['text'] for ei in elements_info)
+        for entrada in self.indice_comentarios:
+            paragraph, segments, full_text = entrada[0], entrada[1], entrada[2]
 
             # Match exato
             idx = full_text.find(texto_busca)
             if idx >= 0:
-                for ei in elements_info:
-                    if ei['start'] <= idx < ei['end']:
-                        return paragraph, ei['element']
+                for s in segments:
+                    if s['start'] <= idx < s['end']:
+                        return paragraph, s['element']
                 continue
 
             # Match normalizado
-            full_norm = normalizar_texto(full_text)
-            if texto_norm in full_norm:
-                return paragraph, elements_info[0]['element']
+            if entrada[3] is None:
+                entrada[3] = normalizar_texto(full_text)
+            if texto_norm in entrada[3]:
+                return paragraph, segments[0]['element']
 
         return None, None
 
@@ -588,7 +852,7 @@ class TrackChangesApplicator:
         affected = match['affected']
 
         first_elem = affected[0]['element']
-        first_idx = list(paragraph).index(first_elem)
+        first_idx = paragraph.index(first_elem)
 
         new_elements = []
 
@@ -624,15 +888,11 @@ class TrackChangesApplicator:
                 )
             )
 
-        # Remove segmentos afetados (deduplicados, mantendo ordem)
+        # Troca os segmentos afetados (deduplicados, mantendo ordem) pelos novos
         unique_elems = list(dict.fromkeys(ar['element'] for ar in affected))
-        for elem in unique_elems:
-            paragraph.remove(elem)
-
-        # Insere novos elementos
-        for i, new_elem in enumerate(new_elements):
-            paragraph.insert(first_idx + i, new_elem)
+        self._trocar_elementos(paragraph, first_idx, unique_elems, new_elements)
 
+        self._reindexar_paragrafo(paragraph)
         self.revision_id += 1
         return True
 
@@ -646,7 +906,7 @@ class TrackChangesApplicator:
         affected = match['affected']
 
         first_elem = affected[0]['element']
-        first_idx = list(paragraph).index(first_elem)
+        first_idx = paragraph.index(first_elem)
 
         new_elements = []
 
@@ -674,12 +934,9 @@ class TrackChangesApplicator:
             )
 
         unique_elems = list(dict.fromkeys(ar['element'] for ar in affected))
-        for elem in unique_elems:
-            paragraph.remove(elem)
-
-        for i, new_elem in enumerate(new_elements):
-            paragraph.insert(first_idx + i, new_elem)
+        self._trocar_elementos(paragraph, first_idx, unique_elems, new_elements)
 
+        self._reindexar_paragrafo(paragraph)
         self.revision_id += 1
         return True
 
@@ -694,7 +951,7 @@ class TrackChangesApplicator:
 
         last_ar = affected[-1]
         last_elem = last_ar['element']
-        last_idx = list(paragraph).index(last_elem)
+        last_idx = paragraph.index(last_elem)
 
         # Usar rPr do contexto para manter formatacao consistente
         ins_elem = self._criar_insercao(texto_novo, last_ar.get('rPr'))
@@ -704,8 +961,6 @@ class TrackChangesApplicator:
             paragraph.insert(last_idx + 1, ins_elem)
         else:
             # Contexto termina no meio do segmento - dividir
-            paragraph.remove(last_elem)
-
             run_antes = self._criar_segmento(
                 last_ar['text'][:last_ar['clip_end']],
                 last_ar['rPr'],
@@ -719,17 +974,31 @@ class TrackChangesApplicator:
                 last_ar['element']
             )
 
-            paragraph.insert(last_idx, run_antes)
-            paragraph.insert(last_idx + 1, ins_elem)
-            paragraph.insert(last_idx + 2, run_depois)
+            paragraph[last_idx:last_idx + 1] = [run_antes, ins_elem, run_depois]
 
+        self._reindexar_paragrafo(paragraph)
         self.revision_id += 1
         return True
 
+    def _trocar_elementos(self, paragraph, first_idx: int, antigos: list, novos: list):
+        """
+        Substitui os elementos antigos (a partir de first_idx) pelos novos.
+        Se os antigos sao irmaos consecutivos, faz uma unica atribuicao de
+        fatia; senao (ha bookmarks, proofErr etc. entre eles, que precisam
+        ser preservados) remove um a um e insere os novos em first_idx.
+        """
+        last_idx = first_idx + len(antigos) - 1
+        if last_idx < len(paragraph) and paragraph[last_idx] is antigos[-1]:
+            paragraph[first_idx:last_idx + 1] = novos
+            return
+
+        for elem in antigos:
+            paragraph.remove(elem)
+        paragraph[first_idx:first_idx] = novos
+
     def _adicionar_comentario_inline(self, texto: str, tipo: str, comentario: str) -> bool:
         """Adiciona um comentario vinculado a um trecho de texto."""
-        match = self._encontrar_texto(texto)
-        if not match:
+        if self._encontrar_texto(texto) is None:
             return False
         self._registrar_comentario(texto, tipo, comentario)
         return True
@@ -752,12 +1021,12 @@ class TrackChangesApplicator:
 
     def _criar_run_com_props(self, texto: str, rPr=None) -> etree._Element:
         """Cria um w:r com texto, copiando formatacao do run original."""
-        r = etree.Element(f'{W_NS}r')
+        r = etree.Element(W_R)
         if rPr is not None:
-            r.append(deepcopy(rPr))
-        t = etree.SubElement(r, f'{W_NS}t')
+            r.append(_clonar(rPr))
+        t = etree.SubElement(r, W_T)
         t.text = texto
-        t.set(f'{XML_NS}space', 'preserve')
+        t.set(XML_SPACE, 'preserve')
         return r
 
     def _criar_hyperlink_com_texto(self, original_hyperlink, texto: str,
@@ -767,17 +1036,17 @@ class TrackChangesApplicator:
         Preserva todos os atributos (r:id, w:history, etc) e namespaces.
         """
         # Deep copy preserva atributos e namespaces
-        new_hl = deepcopy(original_hyperlink)
+        new_hl = _clonar(original_hyperlink)
         # Remove todos os filhos existentes
         for child in list(new_hl):
             new_hl.remove(child)
         # Adiciona novo run com o texto especificado
-        r = etree.SubElement(new_hl, f'{W_NS}r')
+        r = etree.SubElement(new_hl, W_R)
         if rPr is not None:
-            r.append(deepcopy(rPr))
-        t = etree.SubElement(r, f'{W_NS}t')
+            r.append(_clonar(rPr))
+        t = etree.SubElement(r, W_T)
         t.text = texto
-        t.set(f'{XML_NS}space', 'preserve')
+        t.set(XML_SPACE, 'preserve')
         return new_hl
 
     def _criar_delecao_multi(self, affected_segments: list) -> etree._Element:
@@ -785,20 +1054,20 @@ class TrackChangesApplicator:
         Cria elemento w:del com multiplos runs, preservando a formatacao
         original de cada segmento (run ou hyperlink).
         """
-        del_elem = etree.Element(f'{W_NS}del')
-        del_elem.set(f'{W_NS}id', str(self.revision_id))
-        del_elem.set(f'{W_NS}author', self.autor)
-        del_elem.set(f'{W_NS}date', datetime.now().isoformat())
+        del_elem = etree.Element(W_DEL)
+        del_elem.set(W_ID, str(self.revision_id))
+        del_elem.set(W_AUTHOR, self.autor)
+        del_elem.set(W_DATE, self.data_revisao)
 
         for seg in affected_segments:
             matched_text = seg['matched_text']
             if matched_text:
-                del_r = etree.SubElement(del_elem, f'{W_NS}r')
+                del_r = etree.SubElement(del_elem, W_R)
                 if seg.get('rPr') is not None:
-                    del_r.append(deepcopy(seg['rPr']))
-                del_text = etree.SubElement(del_r, f'{W_NS}delText')
+                    del_r.append(_clonar(seg['rPr']))
+                del_text = etree.SubElement(del_r, W_DELTEXT)
                 del_text.text = matched_text
-                del_text.set(f'{XML_NS}space', 'preserve')
+                del_text.set(XML_SPACE, 'preserve')
 
         return del_elem
 
@@ -808,17 +1077,17 @@ class TrackChangesApplicator:
         Opcionalmente copia formatacao (rPr) para manter estilo do texto original
         (ex: titulos, negrito, etc).
         """
-        ins_elem = etree.Element(f'{W_NS}ins')
-        ins_elem.set(f'{W_NS}id', str(self.revision_id + 1000))
-        ins_elem.set(f'{W_NS}author', self.autor)
-        ins_elem.set(f'{W_NS}date', datetime.now().isoformat())
+        ins_elem = etree.Element(W_INS)
+        ins_elem.set(W_ID, str(self.revision_id + 1000))
+        ins_elem.set(W_AUTHOR, self.autor)
+        ins_elem.set(W_DATE, self.data_revisao)
 
-        ins_r = etree.SubElement(ins_elem, f'{W_NS}r')
+        ins_r = etree.SubElement(ins_elem, W_R)
         if rPr is not None:
-            ins_r.append(deepcopy(rPr))
-        ins_text = etree.SubElement(ins_r, f'{W_NS}t')
+            ins_r.append(_clonar(rPr))
+        ins_text = etree.SubElement(ins_r, W_T)
         ins_text.text = texto
-        ins_text.set(f'{XML_NS}space', 'preserve')
+        ins_text.set(XML_SPACE, 'preserve')
 
         return ins_elem
 
@@ -887,23 +1156,23 @@ class TrackChangesApplicator:
         Preserva atributos do hyperlink original (r:id, URL, etc).
         Estrutura: w:hyperlink > w:ins > w:r > w:t
         """
-        new_hl = deepcopy(original_hyperlink)
+        new_hl = _clonar(original_hyperlink)
         # Remove filhos existentes
         for child in list(new_hl):
             new_hl.remove(child)
 
         # Cria w:ins dentro do hyperlink
-        ins_elem = etree.SubElement(new_hl, f'{W_NS}ins')
-        ins_elem.set(f'{W_NS}id', str(self.revision_id + 1000))
-        ins_elem.set(f'{W_NS}author', self.autor)
-        ins_elem.set(f'{W_NS}date', datetime.now().isoformat())
+        ins_elem = etree.SubElement(new_hl, W_INS)
+        ins_elem.set(W_ID, str(self.revision_id + 1000))
+        ins_elem.set(W_AUTHOR, self.autor)
+        ins_elem.set(W_DATE, self.data_revisao)
 
-        ins_r = etree.SubElement(ins_elem, f'{W_NS}r')
+        ins_r = etree.SubElement(ins_elem, W_R)
         if rPr is not None:
-            ins_r.append(deepcopy(rPr))
-        ins_text = etree.SubElement(ins_r, f'{W_NS}t')
+            ins_r.append(_clonar(rPr))
+        ins_text = etree.SubElement(ins_r, W_T)
         ins_text.text = texto
-        ins_text.set(f'{XML_NS}space', 'preserve')
+        ins_text.set(XML_SPACE, 'preserve')
 
         return new_hl
 
@@ -922,25 +1191,22 @@ class TrackChangesApplicator:
 
     def _adicionar_comments(self):
         """Adiciona todos os comentarios registrados ao documento."""
-        NSMAP = {'w': NAMESPACES['w']}
-        comments_xml = etree.Element(f'{W_NS}comments', nsmap=NSMAP)
+        comments_xml = etree.Element(W_COMMENTS, nsmap=COMMENTS_NSMAP)
 
         for comment in self.comments:
-            comm_elem = etree.SubElement(comments_xml, f'{W_NS}comment')
-            comm_elem.set(f'{W_NS}id', str(comment['id']))
-            comm_elem.set(f'{W_NS}author', comment['autor'])
-            comm_elem.set(f'{W_NS}date', datetime.now().isoformat())
-
-            p = etree.SubElement(comm_elem, f'{W_NS}p')
-            r = etree.SubElement(p, f'{W_NS}r')
-            t = etree.SubElement(r, f'{W_NS}t')
+            comm_elem = etree.SubElement(comments_xml, W_COMMENT)
+            comm_elem.set(W_ID, str(comment['id']))
+            comm_elem.set(W_AUTHOR, comment['autor'])
+            comm_elem.set(W_DATE, self.data_revisao)
+
+            p = etree.SubElement(comm_elem, W_P)
+            r = etree.SubElement(p, W_R)
+            t = etree.SubElement(r, W_T)
             t.text = comment['comentario']
 
             self._marcar_texto_comentario(comment)
 
-        comments_path = os.path.join(self.temp_dir, 'word', 'comments.xml')
-        comments_tree = etree.ElementTree(comments_xml)
-        comments_tree.write(comments_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+        self._gravar_parte('word/comments.xml', etree.ElementTree(comments_xml))
 
         self._atualizar_content_types()
         self._atualizar_rels()
@@ -957,19 +1223,19 @@ class TrackChangesApplicator:
         if paragraph is None or target_elem is None:
             return
 
-        idx = list(paragraph).index(target_elem)
+        idx = paragraph.index(target_elem)
 
-        start = etree.Element(f'{W_NS}commentRangeStart')
-        start.set(f'{W_NS}id', str(comment_id))
+        start = etree.Element(W_COMMENT_RANGE_START)
+        start.set(W_ID, str(comment_id))
         paragraph.insert(idx, start)
 
-        end = etree.Element(f'{W_NS}commentRangeEnd')
-        end.set(f'{W_NS}id', str(comment_id))
+        end = etree.Element(W_COMMENT_RANGE_END)
+        end.set(W_ID, str(comment_id))
         paragraph.insert(idx + 2, end)
 
-        ref_r = etree.Element(f'{W_NS}r')
-        ref = etree.SubElement(ref_r, f'{W_NS}commentReference')
-        ref.set(f'{W_NS}id', str(comment_id))
+        ref_r = etree.Element(W_R)
+        ref = etree.SubElement(ref_r, W_COMMENT_REFERENCE)
+        ref.set(W_ID, str(comment_id))
         paragraph.insert(idx + 3, ref_r)
 
     # =========================================================================
@@ -978,62 +1244,100 @@ class TrackChangesApplicator:
 
     def _habilitar_track_changes(self):
         """Habilita o rastreamento de alteracoes no settings.xml."""
-        settings_path = os.path.join(self.temp_dir, 'word', 'settings.xml')
+        settings_tree = self._parse_parte('word/settings.xml')
 
-        if os.path.exists(settings_path):
-            settings_tree = etree.parse(settings_path)
+        if settings_tree is not None:
             settings_root = settings_tree.getroot()
 
-            existing = settings_root.find(f'{W_NS}trackRevisions')
+            existing = settings_root.find(W_TRACK_REVISIONS)
             if existing is None:
-                etree.SubElement(settings_root, f'{W_NS}trackRevisions')
+                etree.SubElement(settings_root, W_TRACK_REVISIONS)
 
-            settings_tree.write(settings_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+            self._gravar_parte('word/settings.xml', settings_tree)
 
     def _atualizar_content_types(self):
         """Atualiza [Content_Types].xml para incluir comments.xml."""
-        content_types_path = os.path.join(self.temp_dir, '[Content_Types].xml')
-        ct_tree = etree.parse(content_types_path)
+        ct_tree = self._parse_parte('[Content_Types].xml')
         ct_root = ct_tree.getroot()
 
-        for override in ct_root.findall('.//{*}Override'):
-            if override.get('PartName') == '/word/comments.xml':
+        # PartName no OPC e case-insensitive: so registra se ainda nao existir
+        for override in ct_root.iterfind('{*}Override'):
+            if (override.get('PartName') or '').lower() == COMMENTS_PART_NAME:
                 return
 
         override = etree.SubElement(ct_root, 'Override')
-        override.set('PartName', '/word/comments.xml')
-        override.set('ContentType',
-                     'application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml')
+        override.set('PartName', COMMENTS_PART_NAME)
+        override.set('ContentType', COMMENTS_CONTENT_TYPE)
 
-        ct_tree.write(content_types_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+        self._gravar_parte('[Content_Types].xml', ct_tree)
 
     def _atualizar_rels(self):
         """Atualiza document.xml.rels para incluir relacionamento com comments.xml."""
-        rels_path = os.path.join(self.temp_dir, 'word', '_rels', 'document.xml.rels')
-        rels_tree = etree.parse(rels_path)
+        rels_tree = self._parse_parte(DOCUMENT_RELS_PART)
+        if rels_tree is None:
+            rels_tree = etree.ElementTree(etree.Element(REL_RELATIONSHIPS, nsmap={None: REL_NS}))
         rels_root = rels_tree.getroot()
 
+        # So pula se ja existe um rel de comentarios apontando para a parte
+        # que sera gravada (o Target pode vir como "comments.xml",
+        # "./comments.xml" ou "/word/comments.xml"); um rel para outra parte
+        # (ex: comments1.xml) nao liga o word/comments.xml novo.
+        # Na mesma passada pega o maior rIdN: com numeracao esparsa,
+        # len(rels_root) + 1 pode repetir um Id existente
+        maior_id = 0
         for rel in rels_root:
-            if rel.get('Target') == 'comments.xml':
+            if (rel.get('Type') == COMMENTS_REL_TYPE
+                    and _parte_do_target(rel.get('Target') or '').lower() == COMMENTS_PART_NAME):
                 return
+            m = REL_ID_RE.match(rel.get('Id') or '')
+            if m:
+                maior_id = max(maior_id, int(m.group(1)))
 
-        rel_count = len(rels_root)
-
-        rel = etree.SubElement(rels_root, f'{{{REL_NS}}}Relationship')
-        rel.set('Id', f'rId{rel_count + 1}')
-        rel.set('Type', 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments')
+        rel = etree.SubElement(rels_root, REL_RELATIONSHIP)
+        rel.set('Id', f'rId{maior_id + 1}')
+        rel.set('Type', COMMENTS_REL_TYPE)
         rel.set('Target', 'comments.xml')
 
-        rels_tree.write(rels_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+        self._gravar_parte(DOCUMENT_RELS_PART, rels_tree)
+
+    def _parse_parte(self, nome: str):
+        """Faz o parse de uma parte XML direto do ZIP de entrada (None se nao existir)."""
+        try:
+            with self.zip_entrada.open(nome) as f:
+                return etree.parse(f, _parser_xml())
+        except KeyError:
+            return None
+
+    def _gravar_parte(self, nome: str, tree):
+        """Serializa uma parte XML alterada/nova para gravacao no ZIP de saida."""
+        self.partes[nome] = etree.tostring(
+            tree, xml_declaration=True, encoding='UTF-8', standalone=True
+        )
 
     def _recompactar_docx(self):
-        """Recompacta o diretorio temporario em um arquivo DOCX."""
-        with zipfile.ZipFile(self.output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root_dir, dirs, files in os.walk(self.temp_dir):
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    arc_name = os.path.relpath(file_path, self.temp_dir)
-                    zipf.write(file_path, arc_name)
+        """
+        Grava o DOCX de saida em uma passada: copia as entradas do ZIP original
+        (mesma ordem, data e compressao), trocando as partes alteradas, e
+        acrescenta as partes novas no fim.
+        """
+        novas = dict(self.partes)
+        with zipfile.ZipFile(self.output_path, 'w', zipfile.ZIP_DEFLATED,
+                             compresslevel=NIVEL_COMPRESSAO_ZIP) as zipf:
+            for item in self.zip_entrada.infolist():
+                data = novas.pop(item.filename, None)
+                if data is None:
+                    data = self.zip_entrada.read(item)
+                # ZipInfo novo: writestr altera o que recebe (tamanhos, CRC,
+                # compress_type) e o item pertence ao zip de entrada.
+                info = zipfile.ZipInfo(item.filename, item.date_time)
+                info.external_attr = item.external_attr
+                if item.filename.lower().endswith(EXTENSOES_JA_COMPRIMIDAS):
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                zipf.writestr(info, data, compresslevel=NIVEL_COMPRESSAO_ZIP)
+            for nome, data in novas.items():
+                zipf.writestr(nome, data)
 
 
 # =============================================================================
@@ -1049,9 +1353,14 @@ class CommentApplicator:
 
         if not self.input_path.exists():
             raise FileNotFoundError(f"Arquivo nao encontrado: {input_path}")
+        # A saida e gravada enquanto o ZIP de entrada ainda esta sendo lido
+        if self.output_path.resolve() == self.input_path.resolve():
+            raise ValueError(f"Arquivo de saida deve ser diferente do de entrada: {output_path}")
 
-        self.temp_dir = None
+        self.zip_entrada = None
+        self.partes = {}
         self.doc_root = None
+        self.indice_paragrafos = None
         self.comments = []  # Lista de dicts para gerar comments.xml
         self.next_comment_id = 0
         self.estatisticas = {
@@ -1078,6 +1387,8 @@ class CommentApplicator:
             dict com estatisticas
         """
         self.autor = autor
+        # Mesmo carimbo para todas as revisoes/comentarios desta aplicacao
+        self.data_revisao = datetime.now().isoformat()
         self.comments = []
         self.next_comment_id = 0
         self.estatisticas = {
@@ -1087,16 +1398,13 @@ class CommentApplicator:
         # Remove marcadores [Pxx|TIPO] que o LLM tenha copiado do prompt
         revisoes = sanitizar_revisoes(revisoes)
 
-        shutil.copy(self.input_path, self.output_path)
-
-        self.temp_dir = tempfile.mkdtemp()
-        with zipfile.ZipFile(self.output_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_dir)
+        self.partes = {}
+        self.zip_entrada = zipfile.ZipFile(self.input_path, 'r')
 
         try:
-            doc_xml_path = os.path.join(self.temp_dir, 'word', 'document.xml')
-            tree = etree.parse(doc_xml_path)
+            tree = self._parse_parte('word/document.xml')
             self.doc_root = tree.getroot()
+            self.indice_paragrafos = None
 
             # Agrupa revisoes por texto_original normalizado
             grupos = self._agrupar_por_texto(revisoes)
@@ -1109,12 +1417,12 @@ class CommentApplicator:
             if self.comments:
                 self._adicionar_comments()
 
-            tree.write(doc_xml_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+            self._gravar_parte('word/document.xml', tree)
             self._recompactar_docx()
 
         finally:
-            if self.temp_dir:
-                shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.zip_entrada.close()
+            self.partes = {}
 
         total = sum(self.estatisticas.values())
         return {
@@ -1131,14 +1439,15 @@ class CommentApplicator:
         Agrupa revisoes por texto_original normalizado (OrderedDict).
         Cada grupo contem a lista de revisoes e o texto_original bruto da primeira.
         """
-        from collections import OrderedDict
         grupos = OrderedDict()
+        # Chaves de todas as revisoes de uma vez (vazias viram '' e sao puladas)
+        chaves = normalizar_textos([rev.get('texto_original') or '' for rev in revisoes])
 
-        for rev in revisoes:
+        for idx, rev in enumerate(revisoes):
             texto_orig = rev.get('texto_original', '')
             if not texto_orig:
                 continue
-            chave = normalizar_texto(texto_orig)
+            chave = chaves[idx]
             if chave not in grupos:
                 grupos[chave] = {
                     'texto_original_bruto': texto_orig,
@@ -1259,10 +1568,8 @@ class CommentApplicator:
         current_pos = 0
 
         for child in paragraph:
-            if child.tag == f'{W_NS}r':
-                run_text = ''
-                for t in child.findall(f'{W_NS}t'):
-                    run_text += (t.text or '')
+            if child.tag == W_R:
+                run_text = ''.join([t.text or '' for t in child if t.tag == W_T])
                 if run_text:
                     segments.append({
                         'element': child,
@@ -1272,11 +1579,9 @@ class CommentApplicator:
                     })
                     current_pos += len(run_text)
 
-            elif child.tag == f'{W_NS}hyperlink':
-                for r in child.findall(f'{W_NS}r'):
-                    hl_text = ''
-                    for t in r.findall(f'{W_NS}t'):
-                        hl_text += (t.text or '')
+            elif child.tag == W_HYPERLINK:
+                for r in child.findall(W_R):
+                    hl_text = ''.join([t.text or '' for t in r if t.tag == W_T])
                     if hl_text:
                         segments.append({
                             'element': child,
@@ -1286,11 +1591,9 @@ class CommentApplicator:
                         })
                         current_pos += len(hl_text)
 
-            elif child.tag == f'{W_NS}ins':
-                for r in child.findall(f'{W_NS}r'):
-                    ins_text = ''
-                    for t in r.findall(f'{W_NS}t'):
-                        ins_text += (t.text or '')
+            elif child.tag == W_INS:
+                for r in child.findall(W_R):
+                    ins_text = ''.join([t.text or '' for t in r if t.tag == W_T])
                     if ins_text:
                         segments.append({
                             'element': child,
@@ -1302,6 +1605,24 @@ class CommentApplicator:
 
         return segments
 
+    def _indexar_paragrafos(self):
+        """
+        Monta (uma unica vez por documento) o indice de texto dos paragrafos.
+        Os marcadores de comentario nao tem w:t, entao o texto dos paragrafos
+        nao muda entre um grupo e outro. Cada entrada e [paragraph, segments,
+        full_text, full_norm]; full_norm so e calculado quando preciso.
+        """
+        if self.indice_paragrafos is None:
+            self.indice_paragrafos = []
+            for paragraph in self.doc_root.iter(W_P):
+                segments = self._obter_segmentos_paragrafo(paragraph)
+                if not segments:
+                    continue
+                full_text = ''.join(s['text'] for s in segments)
+                if full_text.strip():
+                    self.indice_paragrafos.append([paragraph, segments, full_text, None])
+        return self.indice_paragrafos
+
     def _encontrar_texto_avancado(self, texto_busca: str):
         """
         Busca texto no documento com 6 tiers de fallback.
@@ -1318,23 +1639,18 @@ class CommentApplicator:
 
         melhor_jaccard = None  # (score, paragraph, element)
 
-        for paragraph in self.doc_root.iter(f'{W_NS}p'):
-            segments = self._obter_segmentos_paragrafo(paragraph)
-            if not segments:
-                continue
-
-            full_text = ''.join(s['text'] for s in segments)
-            if not full_text.strip():
-                continue
-
-            first_elem = segments[0]['element']
+        for entrada in self._indexar_paragrafos():
+            paragraph, full_text = entrada[0], entrada[2]
+            first_elem = entrada[1][0]['element']
 
             # Tier 1: match exato
             if texto_busca in full_text:
                 return (paragraph, first_elem, 'exato')
 
             # Tier 2: match normalizado
-            full_norm = normalizar_texto(full_text)
+            full_norm = entrada[3]
+            if full_norm is None:
+                full_norm = entrada[3] = normalizar_texto(full_text)
             if texto_norm and texto_norm in full_norm:
                 return (paragraph, first_elem, 'normalizado')
 
@@ -1392,30 +1708,29 @@ class CommentApplicator:
             <w:r><commentReference id="0"/></w:r>
             <w:r><commentReference id="1"/></w:r>
         """
-        idx = list(paragraph).index(target_elem)
-
-        # Insere commentRangeStart para cada comentario (na ordem)
-        for i, cid in enumerate(comment_ids):
-            start = etree.Element(f'{W_NS}commentRangeStart')
-            start.set(f'{W_NS}id', str(cid))
-            paragraph.insert(idx + i, start)
-
-        # O target_elem foi deslocado por len(comment_ids) posicoes
-        target_new_idx = idx + len(comment_ids)
-
-        # Insere commentRangeEnd para cada comentario (apos o target)
-        for i, cid in enumerate(comment_ids):
-            end = etree.Element(f'{W_NS}commentRangeEnd')
-            end.set(f'{W_NS}id', str(cid))
-            paragraph.insert(target_new_idx + 1 + i, end)
-
-        # Insere commentReference para cada comentario (apos os ends)
-        ref_start_idx = target_new_idx + 1 + len(comment_ids)
-        for i, cid in enumerate(comment_ids):
-            ref_r = etree.Element(f'{W_NS}r')
-            ref = etree.SubElement(ref_r, f'{W_NS}commentReference')
-            ref.set(f'{W_NS}id', str(cid))
-            paragraph.insert(ref_start_idx + i, ref_r)
+        idx = paragraph.index(target_elem)
+
+        starts = []
+        ends = []
+        refs = []
+        for cid in comment_ids:
+            start = etree.Element(W_COMMENT_RANGE_START)
+            start.set(W_ID, str(cid))
+            starts.append(start)
+
+            end = etree.Element(W_COMMENT_RANGE_END)
+            end.set(W_ID, str(cid))
+            ends.append(end)
+
+            ref_r = etree.Element(W_R)
+            ref = etree.SubElement(ref_r, W_COMMENT_REFERENCE)
+            ref.set(W_ID, str(cid))
+            refs.append(ref_r)
+
+        # commentRangeEnd + commentReference logo apos o target; depois os
+        # commentRangeStart antes dele (em ordem, cada grupo num splice so)
+        paragraph[idx + 1:idx + 1] = ends + refs
+        paragraph[idx:idx] = starts
 
     # =========================================================================
     # GERACAO DE COMMENTS.XML
@@ -1423,31 +1738,26 @@ class CommentApplicator:
 
     def _adicionar_comments(self):
         """Cria comments.xml com corpo multi-paragrafo."""
-        NSMAP = {'w': NAMESPACES['w']}
-        comments_xml = etree.Element(f'{W_NS}comments', nsmap=NSMAP)
+        comments_xml = etree.Element(W_COMMENTS, nsmap=COMMENTS_NSMAP)
 
         for comment in self.comments:
-            comm_elem = etree.SubElement(comments_xml, f'{W_NS}comment')
-            comm_elem.set(f'{W_NS}id', str(comment['id']))
-            comm_elem.set(f'{W_NS}author', comment['autor'])
-            comm_elem.set(f'{W_NS}date', datetime.now().isoformat())
+            comm_elem = etree.SubElement(comments_xml, W_COMMENT)
+            comm_elem.set(W_ID, str(comment['id']))
+            comm_elem.set(W_AUTHOR, comment['autor'])
+            comm_elem.set(W_DATE, self.data_revisao)
 
             # Corpo multi-paragrafo: cada \n gera um w:p separado
             linhas = comment['corpo'].split('\n')
             for linha in linhas:
-                p = etree.SubElement(comm_elem, f'{W_NS}p')
+                p = etree.SubElement(comm_elem, W_P)
                 if linha.strip():
-                    r = etree.SubElement(p, f'{W_NS}r')
-                    t = etree.SubElement(r, f'{W_NS}t')
+                    r = etree.SubElement(p, W_R)
+                    t = etree.SubElement(r, W_T)
                     t.text = linha
-                    t.set(f'{XML_NS}space', 'preserve')
+                    t.set(XML_SPACE, 'preserve')
                 # Linha vazia: w:p sem filhos (paragrafo vazio = espaco visual)
 
-        comments_path = os.path.join(self.temp_dir, 'word', 'comments.xml')
-        comments_tree = etree.ElementTree(comments_xml)
-        comments_tree.write(
-            comments_path, xml_declaration=True, encoding='UTF-8', standalone=True
-        )
+        self._gravar_parte('word/comments.xml', etree.ElementTree(comments_xml))
 
         self._atualizar_content_types()
         self._atualizar_rels()
@@ -1458,55 +1768,151 @@ class CommentApplicator:
 
     def _atualizar_content_types(self):
         """Atualiza [Content_Types].xml para incluir comments.xml."""
-        content_types_path = os.path.join(self.temp_dir, '[Content_Types].xml')
-        ct_tree = etree.parse(content_types_path)
+        ct_tree = self._parse_parte('[Content_Types].xml')
         ct_root = ct_tree.getroot()
 
-        for override in ct_root.findall('.//{*}Override'):
-            if override.get('PartName') == '/word/comments.xml':
+        # PartName no OPC e case-insensitive: so registra se ainda nao existir
+        for override in ct_root.iterfind('{*}Override'):
+            if (override.get('PartName') or '').lower() == COMMENTS_PART_NAME:
                 return
 
         override = etree.SubElement(ct_root, 'Override')
-        override.set('PartName', '/word/comments.xml')
-        override.set('ContentType',
-                     'application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml')
+        override.set('PartName', COMMENTS_PART_NAME)
+        override.set('ContentType', COMMENTS_CONTENT_TYPE)
 
-        ct_tree.write(content_types_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+        self._gravar_parte('[Content_Types].xml', ct_tree)
 
     def _atualizar_rels(self):
         """Atualiza document.xml.rels para incluir relacionamento com comments.xml."""
-        rels_path = os.path.join(self.temp_dir, 'word', '_rels', 'document.xml.rels')
-        rels_tree = etree.parse(rels_path)
+        rels_tree = self._parse_parte(DOCUMENT_RELS_PART)
+        if rels_tree is None:
+            rels_tree = etree.ElementTree(etree.Element(REL_RELATIONSHIPS, nsmap={None: REL_NS}))
         rels_root = rels_tree.getroot()
 
+        # So pula se ja existe um rel de comentarios apontando para a parte
+        # que sera gravada (o Target pode vir como "comments.xml",
+        # "./comments.xml" ou "/word/comments.xml"); um rel para outra parte
+        # (ex: comments1.xml) nao liga o word/comments.xml novo.
+        # Na mesma passada pega o maior rIdN: com numeracao esparsa,
+        # len(rels_root) + 1 pode repetir um Id existente
+        maior_id = 0
         for rel in rels_root:
-            if rel.get('Target') == 'comments.xml':
+            if (rel.get('Type') == COMMENTS_REL_TYPE
+                    and _parte_do_target(rel.get('Target') or '').lower() == COMMENTS_PART_NAME):
                 return
+            m = REL_ID_RE.match(rel.get('Id') or '')
+            if m:
+                maior_id = max(maior_id, int(m.group(1)))
 
-        rel_count = len(rels_root)
-
-        rel = etree.SubElement(rels_root, f'{{{REL_NS}}}Relationship')
-        rel.set('Id', f'rId{rel_count + 1}')
-        rel.set('Type',
-                'http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments')
+        rel = etree.SubElement(rels_root, REL_RELATIONSHIP)
+        rel.set('Id', f'rId{maior_id + 1}')
+        rel.set('Type', COMMENTS_REL_TYPE)
         rel.set('Target', 'comments.xml')
 
-        rels_tree.write(rels_path, xml_declaration=True, encoding='UTF-8', standalone=True)
+        self._gravar_parte(DOCUMENT_RELS_PART, rels_tree)
+
+    def _parse_parte(self, nome: str):
+        """Faz o parse de uma parte XML direto do ZIP de entrada (None se nao existir)."""
+        try:
+            with self.zip_entrada.open(nome) as f:
+                return etree.parse(f, _parser_xml())
+        except KeyError:
+            return None
+
+    def _gravar_parte(self, nome: str, tree):
+        """Serializa uma parte XML alterada/nova para gravacao no ZIP de saida."""
+        self.partes[nome] = etree.tostring(
+            tree, xml_declaration=True, encoding='UTF-8', standalone=True
+        )
 
     def _recompactar_docx(self):
-        """Recompacta o diretorio temporario em um arquivo DOCX."""
-        with zipfile.ZipFile(self.output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root_dir, dirs, files in os.walk(self.temp_dir):
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    arc_name = os.path.relpath(file_path, self.temp_dir)
-                    zipf.write(file_path, arc_name)
+        """
+        Grava o DOCX de saida em uma passada: copia as entradas do ZIP original
+        (mesma ordem, data e compressao), trocando as partes alteradas, e
+        acrescenta as partes novas no fim.
+        """
+        novas = dict(self.partes)
+        with zipfile.ZipFile(self.output_path, 'w', zipfile.ZIP_DEFLATED,
+                             compresslevel=NIVEL_COMPRESSAO_ZIP) as zipf:
+            for item in self.zip_entrada.infolist():
+                data = novas.pop(item.filename, None)
+                if data is None:
+                    data = self.zip_entrada.read(item)
+                # ZipInfo novo: writestr altera o que recebe (tamanhos, CRC,
+                # compress_type) e o item pertence ao zip de entrada.
+                info = zipfile.ZipInfo(item.filename, item.date_time)
+                info.external_attr = item.external_attr
+                if item.filename.lower().endswith(EXTENSOES_JA_COMPRIMIDAS):
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                zipf.writestr(info, data, compresslevel=NIVEL_COMPRESSAO_ZIP)
+            for nome, data in novas.items():
+                zipf.writestr(nome, data)
 
 
 # =============================================================================
 # FUNCOES DE CONVENIENCIA
 # =============================================================================
 
+def _chave_resultado(modo: str, input_path: str, revisoes: list, autor: str) -> str:
+    """Hash do DOCX de entrada + revisoes + autor (chave do cache de resultados)."""
+    h = hashlib.blake2b(digest_size=16)
+    for parte in (modo, autor, json.dumps(revisoes, sort_keys=True, default=str)):
+        h.update(str(parte).encode('utf-8'))
+        h.update(b'\x00')
+    with open(input_path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _aplicar_com_cache(modo: str, applicator, revisoes: list, autor: str, aplicar) -> dict:
+    """
+    Executa aplicar(revisoes, autor), reaproveitando o DOCX e o resultado de
+    uma execucao identica anterior quando DOCX_RESULT_CACHE_TTL esta ligado.
+    """
+    global _result_cache_bytes
+
+    if RESULT_CACHE_TTL <= 0:
+        return aplicar(revisoes, autor)
+
+    chave = _chave_resultado(modo, applicator.input_path, revisoes, autor)
+
+    with _result_cache_lock:
+        item = _result_cache.get(chave)
+        if item is not None and item[0] < time.monotonic():
+            _result_cache_bytes -= len(item[1])
+            del _result_cache[chave]
+            item = None
+        if item is not None:
+            _result_cache.move_to_end(chave)
+
+    if item is not None:
+        applicator.output_path.write_bytes(item[1])
+        resultado = copy.deepcopy(item[2])
+        resultado['arquivo_saida'] = str(applicator.output_path)
+        print(f"DOCX reaproveitado do cache ({modo})")
+        return resultado
+
+    resultado = aplicar(revisoes, autor)
+    docx_bytes = applicator.output_path.read_bytes()
+
+    with _result_cache_lock:
+        antigo = _result_cache.pop(chave, None)
+        if antigo is not None:
+            _result_cache_bytes -= len(antigo[1])
+        _result_cache[chave] = (
+            time.monotonic() + RESULT_CACHE_TTL, docx_bytes, copy.deepcopy(resultado)
+        )
+        _result_cache_bytes += len(docx_bytes)
+        while _result_cache_bytes > RESULT_CACHE_MAX_BYTES and len(_result_cache) > 1:
+            _, (_, antigo_bytes, _) = _result_cache.popitem(last=False)
+            _result_cache_bytes -= len(antigo_bytes)
+
+    return resultado
+
+
 def aplicar_revisoes_docx(
     input_path: str,
     output_path: str,
@@ -1517,7 +1923,7 @@ def aplicar_revisoes_docx(
     Funcao de conveniencia para aplicar revisoes a um documento.
     """
     applicator = TrackChangesApplicator(input_path, output_path)
-    return applicator.aplicar_revisoes(revisoes, autor)
+    return _aplicar_com_cache('revisoes', applicator, revisoes, autor, applicator.aplicar_revisoes)
 
 
 def aplicar_comentarios_docx(
@@ -1531,4 +1937,4 @@ def aplicar_comentarios_docx(
     Nao altera o texto do documento - apenas adiciona comentarios.
     """
     applicator = CommentApplicator(input_path, output_path)
-    return applicator.aplicar_comentarios(revisoes, autor)
+    return _aplicar_com_cache('comentarios', applicator, revisoes, autor, applicator.aplicar_comentarios)